@@ -0,0 +1,88 @@
+import asyncio
+import os
+import sys
+import time
+import threading
+from itertools import islice
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import universal
+
+
+@pytest.fixture(autouse=True, scope="module")
+def private_db(tmp_path_factory):
+    universal.DB_PATH = str(tmp_path_factory.mktemp("db") / "universal.db")
+
+
+def _config(concurrency, per_host):
+    return {
+        "multi_download": True,
+        "max_concurrent_downloads": concurrency,
+        "per_host_max_concurrent": per_host,
+        "adaptive_concurrency": False,
+    }
+
+
+def _stub_downloads(monkeypatch, playlists):
+    started = {}
+    lock = threading.Lock()
+
+    def download(url, config, job=None):
+        with lock:
+            started.setdefault(url, time.monotonic())
+        if url in playlists:
+            job.pending_expand = lambda: universal._expand_playlist(job, {"title": url}, playlists[url])
+            return True, "", 0, 0
+        time.sleep(0.001)
+        return True, "", 1, 1
+
+    monkeypatch.setattr(universal, "download_universal_video", download)
+    return started
+
+
+def _run(links, config, timeout=30, **kwargs):
+    return asyncio.run(asyncio.wait_for(universal.process_links(links, config, **kwargs), timeout))
+
+
+def test_large_playlist_with_host_cap_of_one(monkeypatch, capsys):
+    entries = [f"https://videos.example/v/{i}" for i in range(300)]
+    started = _stub_downloads(monkeypatch, {"https://videos.example/list": entries})
+    assert _run(["https://videos.example/list"], _config(4, 1)) == 301
+    assert set(entries) <= set(started)
+
+
+def test_several_playlists_from_one_host(monkeypatch, capsys):
+    playlists = {
+        f"https://videos.example/list/{n}": [f"https://videos.example/v/{n}/{i}" for i in range(200)]
+        for n in range(3)
+    }
+    started = _stub_downloads(monkeypatch, playlists)
+    assert _run(list(playlists), _config(4, 3)) == 603
+    assert len(started) == 603
+
+
+def test_other_hosts_start_behind_a_long_run_of_one_host(monkeypatch, capsys):
+    first = [f"https://a.example/v/{i}" for i in range(200)]
+    second = [f"https://b.example/v/{i}" for i in range(10)]
+    started = _stub_downloads(monkeypatch, {})
+    assert _run(first + second, _config(6, 3)) == 210
+    assert min(started[url] for url in second) < max(started[url] for url in first[:20])
+
+
+def test_resume_continues_an_unread_link_file(monkeypatch, capsys, tmp_path):
+    links = [f"https://videos.example/f/{i}" for i in range(50)]
+    path = tmp_path / "links.txt"
+    path.write_bytes("".join(f"{url}\r\n\n" for url in links).encode())
+    started = _stub_downloads(monkeypatch, {})
+    link_file = universal.LinkFile(str(path))
+    _run(islice(iter(link_file), 10), _config(2, 3), link_file=link_file)
+    # Left as if the process died after the first 10 lines.
+    universal.db_connect().execute("UPDATE batches SET status = 'running' WHERE id = (SELECT MAX(id) FROM batches)")
+    pending = universal.journal_find_unfinished()
+    assert pending["file"] == str(path) and pending["remaining"] == 0
+    monkeypatch.setattr(universal, "_wait_for_enter_or_char", lambda chars: "enter")
+    assert asyncio.run(universal.offer_resume_unfinished(_config(2, 3)))
+    assert set(started) == set(links)
+    assert universal.journal_find_unfinished() is None
@@ -4,22 +4,34 @@ import subprocess
 import os
 import json
 import time
+_STARTUP_T0 = time.perf_counter()
 from pathlib import Path
 import asyncio
 import re
 import string
 import datetime
-import aiohttp
 import webbrowser
 import errno
 import random
 import tempfile
-
-try:
-    import yt_dlp
-    import discord
-    from yt_dlp.utils import DownloadError, ExtractorError, PostProcessingError
-except ImportError:
+import threading
+import shutil
+import sqlite3
+import contextlib
+import functools
+import hashlib
+import io
+import zlib
+import importlib.util
+from collections import deque
+from itertools import chain
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+# yt-dlp, discord.py and aiohttp are imported by the features that use them;
+# only check here that they are installed.
+_REQUIRED_MODULES = ("yt_dlp", "discord", "aiohttp")
+if any(importlib.util.find_spec(name) is None for name in _REQUIRED_MODULES):
     print("Missing libraries will be installed...")
     try:
         subprocess.check_call([sys.executable, "-m", "pip", "install", "yt-dlp", "discord.py", "aiohttp"])
@@ -45,6 +57,9 @@ else:
 GITHUB_REPO = "bitnestt/Universal"
 GITHUB_FILE_PATH = "universal.py"
 GITHUB_BRANCH = "main"
+# The API base can point at a local stand-in server for testing.
+UPDATE_API_BASE = os.environ.get("UNIVERSAL_UPDATE_API", "https://api.github.com").rstrip("/")
+UPDATE_CHECK_TIMEOUT = 3.0
 
 def _terminal_width(default=100):
     try:
@@ -69,21 +84,54 @@ def _format_commit_date_utc(iso_str: str) -> str:
     except Exception:
         return None
 
-async def _fetch_latest_universal_commit():
-    api = f"https://api.github.com/repos/{GITHUB_REPO}/commits"
-    params = {"path": GITHUB_FILE_PATH, "sha": GITHUB_BRANCH, "per_page": 1}
+def _update_cache_path():
+    return os.path.join(BASE_DIR, ".universal_commit_cache.json")
+
+def _read_update_cache():
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(api, params=params, headers={"Accept": "application/vnd.github+json"}) as r:
-                if r.status != 200:
-                    return None
-                data = await r.json()
+        with open(_update_cache_path(), "r", encoding="utf-8") as f:
+            cache = json.load(f)
+        return cache if isinstance(cache, dict) else {}
     except Exception:
-        return None
-    if not data:
-        return None
+        return {}
 
-    latest = data[0]
+def _write_update_cache(cache):
+    try:
+        with open(_update_cache_path(), "w", encoding="utf-8") as f:
+            json.dump(cache, f)
+    except Exception:
+        pass
+
+async def _fetch_latest_universal_commit(interval_hours=0):
+    # A check inside the interval reuses the cached answer; otherwise the request
+    # carries the cached ETag, and GitHub's 304 reply does not count against the
+    # unauthenticated rate limit.
+    cache = _read_update_cache()
+    latest = cache.get("latest")
+    fresh = time.time() - float(cache.get("checked") or 0) < float(interval_hours or 0) * 3600
+    if not (fresh and latest):
+        import aiohttp
+        api = f"{UPDATE_API_BASE}/repos/{GITHUB_REPO}/commits"
+        params = {"path": GITHUB_FILE_PATH, "sha": GITHUB_BRANCH, "per_page": 1}
+        headers = {"Accept": "application/vnd.github+json"}
+        if cache.get("etag") and latest:
+            headers["If-None-Match"] = cache["etag"]
+        try:
+            timeout = aiohttp.ClientTimeout(total=UPDATE_CHECK_TIMEOUT)
+            async with aiohttp.ClientSession(timeout=timeout) as session:
+                async with session.get(api, params=params, headers=headers) as r:
+                    if r.status == 200:
+                        data = await r.json()
+                        latest = data[0] if data else None
+                        cache = {"etag": r.headers.get("ETag"), "latest": latest}
+                    elif r.status != 304:
+                        return None
+        except Exception:
+            return None
+        cache["checked"] = time.time()
+        _write_update_cache(cache)
+    if not latest:
+        return None
     sha_full = (latest.get("sha") or "")
     sha_short = sha_full[:12] if sha_full else ""
     raw_msg = ((latest.get("commit") or {}).get("message") or "").strip()
@@ -198,8 +246,17 @@ def _wait_for_enter_or_char(alt_char: str = None):
                 if alt_char and choice == alt_char.lower():
                     return alt_char.lower()
 
-async def show_update_notice_if_any():
-    info = await _fetch_latest_universal_commit()
+def start_update_check(config):
+    interval = config.get("update_check_interval_hours", 6)
+    return asyncio.create_task(_fetch_latest_universal_commit(interval))
+
+async def show_update_notice_if_any(pending):
+    # The check has been running in the background since startup; never wait
+    # on it longer than its own timeout.
+    try:
+        info = await asyncio.wait_for(pending, UPDATE_CHECK_TIMEOUT)
+    except Exception:
+        return
     if not info:
         return
 
@@ -255,12 +312,63 @@ def wait_enter():
     except Exception:
         pass
 
-def check_ffmpeg():
+# ---------------- FFmpeg probe ----------------
+# Probed once per process; re-probed only if the ffmpeg binary on PATH changes.
+_ffmpeg_lock = threading.Lock()
+_ffmpeg_probe = {"key": None, "info": None}
+
+def _ffmpeg_table(path, flag):
+    r = subprocess.run([path, "-hide_banner", flag], check=True, capture_output=True, text=True)
+    names = set()
+    in_body = False
+    for ln in r.stdout.splitlines():
+        s = ln.strip()
+        if not in_body:
+            in_body = s.startswith("--")
+            continue
+        parts = s.split(None, 2)
+        if len(parts) >= 2:
+            names.update(n for n in parts[1].split(",") if n)
+    return frozenset(names)
+
+def _run_ffmpeg_probe(path):
+    r = subprocess.run([path, "-version"], check=True, capture_output=True, text=True)
+    first = (r.stdout.splitlines() or [""])[0]
+    m = re.match(r"ffmpeg version (\S+)", first)
+    encoders = _ffmpeg_table(path, "-encoders")
+    muxers = _ffmpeg_table(path, "-muxers")
+    return {
+        "path": path,
+        "version": m.group(1) if m else first.strip(),
+        "encoders": encoders,
+        "muxers": muxers,
+        "stream_copy": "mp4" in muxers,
+    }
+
+def probe_ffmpeg():
+    path = shutil.which("ffmpeg")
     try:
-        subprocess.run(["ffmpeg", "-version"], check=True, capture_output=True, text=True)
-        return True
-    except (FileNotFoundError, subprocess.CalledProcessError):
-        return False
+        key = (path, os.stat(path).st_mtime_ns) if path else None
+    except OSError:
+        key = None
+    with _ffmpeg_lock:
+        if _ffmpeg_probe["key"] == key:
+            return _ffmpeg_probe["info"]
+        info = None
+        if key:
+            try:
+                info = _run_ffmpeg_probe(path)
+            except (OSError, subprocess.CalledProcessError):
+                info = None
+        _ffmpeg_probe.update({"key": key, "info": info})
+        return info
+
+def ffmpeg_has_encoder(name):
+    info = probe_ffmpeg()
+    return bool(info) and name in info["encoders"]
+
+def check_ffmpeg():
+    return probe_ffmpeg() is not None
 
 # ----------------------- Config -----------------------
 def load_config():
@@ -273,7 +381,24 @@ def load_config():
         "audio_only": False,
         "multi_download": False,
         "max_concurrent_downloads": 3,
-        "embed_mp3_cover": True
+        "embed_mp3_cover": True,
+        "adaptive_concurrency": False,
+        "adaptive_max_downloads": 12,
+        "adaptive_max_fragments": 8,
+        "per_host_max_concurrent": 3,
+        "per_host_min_interval_s": 0.5,
+        "host_failure_threshold": 5,
+        "download_archive": True,
+        "discord_streaming": True,
+        "dedupe_mode": "hardlink",
+        "metadata_cache_ttl_hours": 6,
+        "metadata_cache_max_mb": 32,
+        "audio_policy": "mp3",
+        "audio_accept_codecs": ["mp3", "aac", "opus"],
+        "audio_target_kbps": 0,
+        "thumbnail_cache_max_mb": 64,
+        "output_sharding": "off",
+        "update_check_interval_hours": 6
     }
     if os.path.exists(config_file_path):
         try:
@@ -315,22 +440,64 @@ def _random_digits(min_len=4, max_len=8):
     n = random.randint(min_len, max_len)
     return ''.join(random.choice("0123456789") for _ in range(n))
 
+# Output names are reserved by stem (the name without media/temp extensions), so
+# "x.webm" blocks "x.mp4" too: conversions, thumbnails and .part files all share
+# the stem. Each directory is scanned once; after that reservations are decided
+# in memory under one lock, so concurrent workers never pick the same name and
+# a large (or network-mounted) folder is not stat'ed per candidate.
+OUTPUT_SUFFIXES = {"mp4", "webm", "mkv", "mov", "m4a", "mp3", "opus", "ogg", "flac",
+                   "jpg", "jpeg", "png", "webp", "part", "ytdl", "temp"}
+
+def _output_stem(name):
+    stem, ext = os.path.splitext(name)
+    while ext[1:].lower() in OUTPUT_SUFFIXES and stem:
+        name = stem
+        stem, ext = os.path.splitext(name)
+    return name
+
+class PathAllocator:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._dirs = {}
+
+    def _stems(self, directory):
+        stems = self._dirs.get(directory)
+        if stems is None:
+            stems = set()
+            try:
+                with os.scandir(directory) as it:
+                    for entry in it:
+                        stems.add(_output_stem(entry.name))
+            except OSError:
+                pass
+            self._dirs[directory] = stems
+        return stems
+
+    def reserve(self, directory, base_name, ext):
+        directory = os.path.abspath(directory)
+        ts = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+        candidates = chain([base_name, f"{base_name}_{ts}"], (f"{base_name}_{ts}_{i}" for i in range(100)))
+        with self._lock:
+            stems = self._stems(directory)
+            for stem in candidates:
+                if stem not in stems:
+                    stems.add(stem)
+                    return os.path.join(directory, f"{stem}.{ext}")
+        raise RuntimeError("Could not generate unique filename.")
+
+OUTPUT_PATHS = PathAllocator()
+
+def output_directory(config, base_name):
+    base_dir = config["download_path"]
+    mode = str(config.get("output_sharding") or "off").lower()
+    if mode == "date":
+        return os.path.join(base_dir, datetime.date.today().strftime("%Y-%m"))
+    if mode == "hash":
+        return os.path.join(base_dir, hashlib.blake2b(base_name.encode("utf-8"), digest_size=1).hexdigest())
+    return base_dir
+
 def get_unique_filename(base_dir, base_name, ext):
-    candidate = f"{base_name}.{ext}"
-    path_candidate = os.path.join(base_dir, candidate)
-    if not os.path.exists(path_candidate):
-        return path_candidate
-    ts = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-    candidate = f"{base_name}_{ts}.{ext}"
-    path_candidate = os.path.join(base_dir, candidate)
-    if not os.path.exists(path_candidate):
-        return path_candidate
-    for i in range(100):
-        candidate = f"{base_name}_{ts}_{i}.{ext}"
-        path_candidate = os.path.join(base_dir, candidate)
-        if not os.path.exists(path_candidate):
-            return path_candidate
-    raise RuntimeError("Could not generate unique filename.")
+    return OUTPUT_PATHS.reserve(base_dir, base_name, ext)
 
 TRAILING_CHARS = '>)],.;\'"\u2018\u2019\u201c\u201d\u201e`\u00b4!?'
 
@@ -399,26 +566,93 @@ def _rate_label(bps: int) -> str:
         return f"{int(mb)} MB/s"
     return f"{mb:.2f} MB/s"
 
-STATS_PATH = os.path.join(BASE_DIR, ".universal_stats.json")
+# ---------------- Local database ----------------
+# One SQLite file holds stats and other persistent state. WAL mode lets
+# worker threads and other running instances read and write concurrently.
+DB_PATH = os.path.join(BASE_DIR, ".universal.db")
+_db_local = threading.local()
+_db_init_lock = threading.Lock()
+_db_schemas = []
+_db_ready = {"done": False}
+
+def register_db_schema(sql):
+    _db_schemas.append(sql)
+
+def db_connect():
+    conn = getattr(_db_local, "conn", None)
+    if conn is not None:
+        return conn
+    conn = sqlite3.connect(DB_PATH, timeout=30, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    with _db_init_lock:
+        if not _db_ready["done"]:
+            for sql in _db_schemas:
+                conn.executescript(sql)
+            _db_ready["done"] = True
+    _db_local.conn = conn
+    return conn
+
+@contextlib.contextmanager
+def db_write():
+    conn = db_connect()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
+
+# ---------------- Stats ----------------
+LEGACY_STATS_PATH = os.path.join(BASE_DIR, ".universal_stats.json")
 STATS_RETENTION_DAYS = 14
-
-def _load_stats_raw():
+STATS_PRUNE_EVERY = 200
+
+register_db_schema("""
+CREATE TABLE IF NOT EXISTS stat_events (
+    ts INTEGER NOT NULL,
+    day TEXT NOT NULL,
+    domain TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    duration REAL NOT NULL,
+    ok INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS stat_events_ts ON stat_events (ts);
+CREATE TABLE IF NOT EXISTS stat_daily (
+    day TEXT PRIMARY KEY,
+    count INTEGER NOT NULL DEFAULT 0,
+    bytes INTEGER NOT NULL DEFAULT 0,
+    failures INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS stat_domain_daily (
+    day TEXT NOT NULL,
+    domain TEXT NOT NULL,
+    count INTEGER NOT NULL DEFAULT 0,
+    bytes INTEGER NOT NULL DEFAULT 0,
+    duration REAL NOT NULL DEFAULT 0,
+    failures INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, domain)
+) WITHOUT ROWID;
+""")
+
+_stats_writes = {"n": 0}
+
+def _local_day(dt=None):
     try:
-        if os.path.exists(STATS_PATH):
-            with open(STATS_PATH, "r", encoding="utf-8") as f:
-                return json.load(f)
+        dt = (dt or datetime.datetime.now(datetime.timezone.utc)).astimezone()
     except Exception:
-        pass
-    return {"events": []}
+        dt = dt or datetime.datetime.now(datetime.timezone.utc)
+    return dt.date().isoformat()
 
-def _save_stats_raw(data):
+def url_domain(url):
     try:
-        tmp = STATS_PATH + ".tmp"
-        with open(tmp, "w", encoding="utf-8") as f:
-            json.dump(data, f, indent=2)
-        os.replace(tmp, STATS_PATH)
-    except Exception:
-        pass
+        host = (urlparse(url).hostname or "").lower()
+    except ValueError:
+        host = ""
+    if host.startswith("www."):
+        host = host[4:]
+    return host or "unknown"
 
 def parse_event_timestamp(ts: str):
     if not ts:
@@ -430,72 +664,387 @@ def parse_event_timestamp(ts: str):
     except Exception:
         return None
 
-def _prune_stats(data):
+def _insert_stat(conn, dt, domain, size, duration, ok):
+    day = _local_day(dt)
+    conn.execute(
+        "INSERT INTO stat_events (ts, day, domain, size, duration, ok) VALUES (?, ?, ?, ?, ?, ?)",
+        (int(dt.timestamp()), day, domain, size, duration, 1 if ok else 0)
+    )
+    conn.execute(
+        "INSERT INTO stat_daily (day, count, bytes, failures) VALUES (?, ?, ?, ?) "
+        "ON CONFLICT(day) DO UPDATE SET count = count + excluded.count, "
+        "bytes = bytes + excluded.bytes, failures = failures + excluded.failures",
+        (day, 1 if ok else 0, size, 0 if ok else 1)
+    )
+    conn.execute(
+        "INSERT INTO stat_domain_daily (day, domain, count, bytes, duration, failures) VALUES (?, ?, ?, ?, ?, ?) "
+        "ON CONFLICT(day, domain) DO UPDATE SET count = count + excluded.count, bytes = bytes + excluded.bytes, "
+        "duration = duration + excluded.duration, failures = failures + excluded.failures",
+        (day, domain, 1 if ok else 0, size, duration, 0 if ok else 1)
+    )
+
+def _prune_stats(conn):
     cutoff = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=STATS_RETENTION_DAYS)
-    new_events = []
+    conn.execute("DELETE FROM stat_events WHERE ts < ?", (int(cutoff.timestamp()),))
+    conn.execute("DELETE FROM stat_daily WHERE day < ?", (_local_day(cutoff),))
+    conn.execute("DELETE FROM stat_domain_daily WHERE day < ?", (_local_day(cutoff),))
+
+def _migrate_legacy_stats(conn):
+    if not os.path.exists(LEGACY_STATS_PATH):
+        return
+    try:
+        with open(LEGACY_STATS_PATH, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except Exception:
+        data = {}
     for ev in data.get("events", []):
         dt = parse_event_timestamp(ev.get("ts", ""))
-        if dt and dt >= cutoff:
-            new_events.append(ev)
-    data["events"] = new_events
-    return data
+        if dt:
+            _insert_stat(conn, dt, "unknown", int(ev.get("size") or 0), 0.0, True)
+    os.replace(LEGACY_STATS_PATH, LEGACY_STATS_PATH + ".migrated")
 
 def _init_stats_file():
-    if not os.path.exists(STATS_PATH):
-        try:
-            _save_stats_raw({"events": []})
-        except Exception:
-            pass
+    try:
+        with db_write() as conn:
+            _migrate_legacy_stats(conn)
+            _prune_stats(conn)
+    except Exception:
+        pass
 
-def record_download_stat(size_bytes):
+def _record_stat(url, size_bytes, duration, ok):
     try:
-        data = _load_stats_raw()
-        ev = {
-            "ts": datetime.datetime.now(datetime.timezone.utc).replace(microsecond=0).isoformat().replace("+00:00", "Z"),
-            "size": int(size_bytes or 0)
-        }
-        data.setdefault("events", []).append(ev)
-        data = _prune_stats(data)
-        _save_stats_raw(data)
+        now = datetime.datetime.now(datetime.timezone.utc).replace(microsecond=0)
+        with db_write() as conn:
+            _insert_stat(conn, now, url_domain(url), int(size_bytes or 0), float(duration or 0.0), ok)
+            _stats_writes["n"] += 1
+            if _stats_writes["n"] % STATS_PRUNE_EVERY == 0:
+                _prune_stats(conn)
     except Exception:
         pass
 
+def record_download_stat(size_bytes, url=None, duration=0.0):
+    _record_stat(url, size_bytes, duration, True)
+
+def record_download_failure(url=None, duration=0.0):
+    _record_stat(url, 0, duration, False)
+
 def get_today_stats():
     try:
-        tz = datetime.datetime.now().astimezone().tzinfo
+        row = db_connect().execute(
+            "SELECT count, bytes FROM stat_daily WHERE day = ?", (_local_day(),)
+        ).fetchone()
     except Exception:
-        tz = datetime.timezone.utc
-    today = datetime.datetime.now(tz).date()
-    data = _load_stats_raw()
-    count = 0
-    total = 0
-    for ev in data.get("events", []):
-        dt = parse_event_timestamp(ev.get("ts", ""))
-        if not dt:
-            continue
+        row = None
+    if not row:
+        return 0, 0
+    return int(row[0]), int(row[1])
+
+# ---------------- Download archive ----------------
+# Remembers finished downloads by extractor + media id (and by URL, so a repeat
+# link is skipped before any network request). Audio and video are separate kinds.
+register_db_schema("""
+CREATE TABLE IF NOT EXISTS archive (
+    extractor TEXT NOT NULL,
+    video_id TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    path TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    added INTEGER NOT NULL,
+    PRIMARY KEY (extractor, video_id, kind)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS archive_urls (
+    url TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    extractor TEXT NOT NULL,
+    video_id TEXT NOT NULL,
+    PRIMARY KEY (url, kind)
+) WITHOUT ROWID;
+""")
+
+def _archive_entry(row):
+    if not row:
+        return None
+    path, size = row
+    if not os.path.exists(path):
+        return None
+    return {"path": path, "size": int(size or 0)}
+
+def archive_lookup_url(url, kind):
+    try:
+        row = db_connect().execute(
+            "SELECT a.path, a.size FROM archive_urls u JOIN archive a "
+            "ON a.extractor = u.extractor AND a.video_id = u.video_id AND a.kind = u.kind "
+            "WHERE u.url = ? AND u.kind = ?", (url, kind)
+        ).fetchone()
+    except sqlite3.Error:
+        return None
+    return _archive_entry(row)
+
+def archive_lookup_id(extractor, video_id, kind):
+    if not extractor or not video_id:
+        return None
+    try:
+        row = db_connect().execute(
+            "SELECT path, size FROM archive WHERE extractor = ? AND video_id = ? AND kind = ?",
+            (extractor, str(video_id), kind)
+        ).fetchone()
+    except sqlite3.Error:
+        return None
+    return _archive_entry(row)
+
+def archive_add(url, extractor, video_id, kind, path=None, size=0):
+    if not extractor or not video_id:
+        return
+    try:
+        with db_write() as conn:
+            if path:
+                conn.execute(
+                    "INSERT OR REPLACE INTO archive (extractor, video_id, kind, path, size, added) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (extractor, str(video_id), kind, path, int(size or 0), int(time.time()))
+                )
+            conn.execute(
+                "INSERT OR REPLACE INTO archive_urls (url, kind, extractor, video_id) VALUES (?, ?, ?, ?)",
+                (url, kind, extractor, str(video_id))
+            )
+    except sqlite3.Error:
+        pass
+
+# ---------------- Metadata cache ----------------
+# Extractor results (title, duration, ids, flat playlist entries) keyed by the
+# extractor that claims the URL plus the cleaned URL, stored as zlib-compressed
+# JSON. Media URLs are never cached; a hit still resolves them at download time.
+METADATA_CACHE_FIELDS = ("title", "duration", "id", "extractor_key", "extractor", "webpage_url", "thumbnail")
+METADATA_CACHE_PRUNE_EVERY = 100
+EXTRACTOR_KEY_CACHE_SIZE = 4096
+
+register_db_schema("""
+CREATE TABLE IF NOT EXISTS metadata_cache (
+    extractor TEXT NOT NULL,
+    url TEXT NOT NULL,
+    data BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    fetched INTEGER NOT NULL,
+    used INTEGER NOT NULL,
+    PRIMARY KEY (extractor, url)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS metadata_cache_used ON metadata_cache (used);
+""")
+
+_extractor_lock = threading.Lock()
+_extractor_classes = []
+_metadata_writes = {"n": 0}
+
+# Matching a URL runs suitable() on every extractor class (several ms for generic
+# URLs); a job asks twice (cache get and put), and playlist entries repeat.
+@functools.lru_cache(maxsize=EXTRACTOR_KEY_CACHE_SIZE)
+def url_extractor_key(url):
+    with _extractor_lock:
+        if not _extractor_classes:
+            from yt_dlp.extractor import gen_extractor_classes
+            _extractor_classes.extend(gen_extractor_classes())
+    for ie in _extractor_classes:
+        if ie.suitable(url):
+            return ie.ie_key()
+    return "Generic"
+
+def metadata_cache_get(url, config):
+    ttl = float(config.get("metadata_cache_ttl_hours") or 0) * 3600
+    if ttl <= 0:
+        return None
+    key = url_extractor_key(url)
+    now = int(time.time())
+    try:
+        row = db_connect().execute(
+            "SELECT data, fetched FROM metadata_cache WHERE extractor = ? AND url = ?", (key, url)
+        ).fetchone()
+        if not row:
+            return None
+        if row[1] < now - ttl:
+            with db_write() as conn:
+                conn.execute("DELETE FROM metadata_cache WHERE extractor = ? AND url = ?", (key, url))
+            return None
+        with db_write() as conn:
+            conn.execute("UPDATE metadata_cache SET used = ? WHERE extractor = ? AND url = ?", (now, key, url))
+        return json.loads(zlib.decompress(row[0]))
+    except (sqlite3.Error, zlib.error, ValueError):
+        return None
+
+def _prune_metadata_cache(conn, config):
+    ttl = float(config.get("metadata_cache_ttl_hours") or 0) * 3600
+    limit = int(float(config.get("metadata_cache_max_mb") or 0) * 1024 * 1024)
+    conn.execute("DELETE FROM metadata_cache WHERE fetched < ?", (int(time.time() - ttl),))
+    total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM metadata_cache").fetchone()[0]
+    if total <= limit:
+        return
+    doomed = []
+    for extractor, url, size in conn.execute("SELECT extractor, url, size FROM metadata_cache ORDER BY used"):
+        if total <= limit:
+            break
+        doomed.append((extractor, url))
+        total -= size
+    conn.executemany("DELETE FROM metadata_cache WHERE extractor = ? AND url = ?", doomed)
+
+def metadata_cache_put(url, info, config):
+    if float(config.get("metadata_cache_ttl_hours") or 0) <= 0:
+        return
+    data = {k: info.get(k) for k in METADATA_CACHE_FIELDS if info.get(k) is not None}
+    if info.get("_type") == "playlist":
+        data["_type"] = "playlist"
+        data["entries"] = list(info.get("entries") or ())
+    blob = zlib.compress(json.dumps(data, separators=(",", ":")).encode("utf-8"), 6)
+    now = int(time.time())
+    try:
+        with db_write() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO metadata_cache (extractor, url, data, size, fetched, used) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (url_extractor_key(url), url, blob, len(blob), now, now)
+            )
+            _metadata_writes["n"] += 1
+            if _metadata_writes["n"] % METADATA_CACHE_PRUNE_EVERY == 0:
+                _prune_metadata_cache(conn, config)
+    except sqlite3.Error:
+        pass
+
+# ---------------- Content dedup ----------------
+# Hashes each downloaded stream while it is being written (the hooks read only
+# the newly appended bytes, still hot in the page cache), so identical media
+# arriving from another URL can be linked to the existing file.
+HASH_READ_CHUNK = 4 * 1024 * 1024
+
+register_db_schema("""
+CREATE TABLE IF NOT EXISTS content_hashes (
+    digest TEXT PRIMARY KEY,
+    path TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    added INTEGER NOT NULL
+) WITHOUT ROWID;
+""")
+
+class StreamHasher:
+    __slots__ = ("lock", "files", "digests")
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.files = {}
+        self.digests = {}
+
+    @staticmethod
+    def _read(path, ent):
         try:
-            dt_local = dt.astimezone(tz)
-        except Exception:
-            dt_local = dt
-        if dt_local.date() == today:
-            count += 1
-            total += int(ev.get("size") or 0)
-    return count, total
+            with open(path, "rb") as f:
+                f.seek(0, os.SEEK_END)
+                end = f.tell()
+                if end < ent[1]:
+                    # The downloader restarted the file from scratch.
+                    ent[0] = hashlib.blake2b(digest_size=32)
+                    ent[1] = 0
+                f.seek(ent[1])
+                while True:
+                    chunk = f.read(1024 * 1024)
+                    if not chunk:
+                        break
+                    ent[0].update(chunk)
+                    ent[1] += len(chunk)
+            return True
+        except OSError:
+            return False
+
+    def hook(self, d):
+        name = d.get('filename')
+        if not name:
+            return
+        status = d.get('status')
+        with self.lock:
+            if status == 'downloading':
+                ent = self.files.get(name)
+                if ent is None:
+                    ent = self.files[name] = [hashlib.blake2b(digest_size=32), 0, None]
+                ent[2] = d.get('tmpfilename') or ent[2]
+                if ent[2] and int(d.get('downloaded_bytes') or 0) - ent[1] >= HASH_READ_CHUNK:
+                    self._read(ent[2], ent)
+            elif status == 'finished':
+                ent = self.files.pop(name, None)
+                if ent is not None and self._read(name, ent):
+                    self.digests[name] = ent[0].hexdigest()
+
+    def content_key(self, final_ext):
+        with self.lock:
+            if not self.digests or self.files:
+                return None
+            h = hashlib.blake2b(digest_size=32)
+            for digest in sorted(self.digests.values()):
+                h.update(digest.encode("ascii"))
+            h.update(f"|{final_ext}".encode("utf-8"))
+            return h.hexdigest()
+
+def content_dedupe(digest, path, size, mode):
+    if not digest:
+        return None
+    try:
+        row = db_connect().execute(
+            "SELECT path FROM content_hashes WHERE digest = ?", (digest,)
+        ).fetchone()
+    except sqlite3.Error:
+        return None
+    existing = row[0] if row else None
+    if existing and existing != path and os.path.exists(existing):
+        if mode == "hardlink":
+            tmp_link = path + ".dedup"
+            try:
+                os.link(existing, tmp_link)
+                os.replace(tmp_link, path)
+                return existing
+            except OSError:
+                try:
+                    if os.path.exists(tmp_link):
+                        os.remove(tmp_link)
+                except OSError:
+                    pass
+        try:
+            os.remove(path)
+        except OSError:
+            return None
+        return existing
+    try:
+        with db_write() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO content_hashes (digest, path, size, added) VALUES (?, ?, ?, ?)",
+                (digest, path, int(size or 0), int(time.time()))
+            )
+    except sqlite3.Error:
+        pass
+    return None
+
+# Status codes only count next to "HTTP"/"status" (or as "NNN Client Error"), so
+# ids, URLs and sizes in yt-dlp messages that contain e.g. 429 are not misread.
+HTTP_STATUS_RE = re.compile(
+    r'\bhttp(?:\s+error)?\s*:?\s*(\d{3})\b|\bstatus(?:\s+code)?\s*:?\s*(\d{3})\b|\b(\d{3})\s+(?:client|server)\s+error\b',
+    re.IGNORECASE
+)
+
+def _http_status(msg):
+    m = HTTP_STATUS_RE.search(msg or "")
+    if not m:
+        return None
+    return int(next(g for g in m.groups() if g))
 
 def _friendly_protection_message(raw_msg: str) -> str:
     raw = (raw_msg or "").strip()
     lower = raw.lower()
+    status = _http_status(raw)
     if "cloudflare" in lower:
         return "Blocked by site protection (e.g., Cloudflare). Provide cookies or try later."
-    if "403" in lower:
+    if status == 403:
         return "Access denied (HTTP 403). Provide cookies/login or retry later."
-    if "429" in lower:
+    if status == 429 or "too many requests" in lower:
         return "Too many requests (HTTP 429). You are rate-limited, Wait and retry."
-    if "401" in lower:
+    if status == 401:
         return "Unauthorized (HTTP 401). Authentication required."
-    if "404" in lower or "not found" in lower:
+    if status == 404 or "not found" in lower:
         return "Resource not found (HTTP 404). Check the link."
-    if any(c in lower for c in ("502", "503", "504", "5xx")):
+    if status in (502, 503, 504):
         return "Server error (HTTP 5xx). Retry later."
     if "timed out" in lower or "timeout" in lower:
         return "Request timed out. Check your connection and retry."
@@ -507,6 +1056,35 @@ def _friendly_protection_message(raw_msg: str) -> str:
         return "DNS resolution failed."
     return raw or "Download failed."
 
+def _error_class(msg: str) -> str:
+    lower = (msg or "").lower()
+    if "no space left" in lower:
+        return "disk"
+    if "ffmpeg" in lower or "post-processing" in lower:
+        return "postprocess"
+    if "output file not found" in lower:
+        return "output"
+    status = _http_status(msg)
+    if status == 429 or "too many requests" in lower:
+        return "rate_limited"
+    if "cloudflare" in lower or status == 403:
+        return "forbidden"
+    if status == 401:
+        return "unauthorized"
+    if status == 404 or "not found" in lower:
+        return "not_found"
+    if (status is not None and 500 <= status < 600) or "http 5xx" in lower:
+        return "server"
+    if "timed out" in lower or "timeout" in lower:
+        return "timeout"
+    if "ssl" in lower or "certificate" in lower:
+        return "ssl"
+    if any(c in lower for c in ("name or service not known",
+                                "temporary failure in name resolution",
+                                "getaddrinfo", "dns")):
+        return "dns"
+    return "other"
+
 # ---------------- Smart cookie cleaning ----------------
 def _iter_json_candidates(data):
     if isinstance(data, list):
@@ -605,16 +1183,27 @@ def _convert_json_to_netscape_lines(data):
             lines.append(row)
     return lines
 
-def prepare_clean_cookie_tempfile():
-    cookie_path = os.path.join(BASE_DIR, "cookies.txt")
-    if not os.path.exists(cookie_path):
-        return None
-    try:
-        with open(cookie_path, "rb") as f:
-            raw = f.read()
-    except Exception:
-        return None
-
+COOKIE_PATH = os.path.join(BASE_DIR, "cookies.txt")
+
+# Parsed once and shared by every job; reloaded when cookies.txt changes on disk.
+_cookie_lock = threading.Lock()
+_cookie_store = {"key": None, "rows": [], "by_domain": {}, "by_host": {}}
+
+# Short-link hosts carry no cookies of their own but redirect to a site that may
+# need its cookies. Any other host without matching cookies gets no jar at all.
+COOKIE_REDIRECT_HOSTS = {
+    "youtu.be": ("youtube.com", "google.com"),
+    "t.co": ("twitter.com", "x.com"),
+    "vm.tiktok.com": ("tiktok.com",),
+    "vt.tiktok.com": ("tiktok.com",),
+    "redd.it": ("reddit.com",),
+    "fb.watch": ("facebook.com",),
+    "b23.tv": ("bilibili.com",),
+    "on.soundcloud.com": ("soundcloud.com",),
+    "pin.it": ("pinterest.com",),
+}
+
+def _read_cookie_rows(raw):
     text_probe = None
     for enc in ("utf-8-sig", "utf-8", "utf-16", "latin-1"):
         try:
@@ -629,336 +1218,1310 @@ def prepare_clean_cookie_tempfile():
                 data = json.loads(text_probe)
                 json_lines = _convert_json_to_netscape_lines(data)
                 if json_lines:
-                    tf = tempfile.NamedTemporaryFile(mode="w+", delete=False, encoding="utf-8", newline="\n")
-                    tf.write("# Netscape HTTP Cookie File\n")
-                    tf.write("\n".join(json_lines) + "\n")
-                    tf.close()
-                    return tf.name
+                    return json_lines
             except Exception:
                 pass
+    return _parse_and_clean_cookies_txt_bytes(raw)
 
-    lines = _parse_and_clean_cookies_txt_bytes(raw)
-    if lines:
-        tf = tempfile.NamedTemporaryFile(mode="w+", delete=False, encoding="utf-8", newline="\n")
-        tf.write("# Netscape HTTP Cookie File\n")
-        tf.write("\n".join(lines) + "\n")
-        tf.close()
-        return tf.name
-    return None
+def _cookie_row_domain(row):
+    domain = row.split("\t", 1)[0].strip().lower()
+    if domain.startswith("httponly_"):
+        domain = domain[len("httponly_"):]
+    return domain.lstrip(".")
 
-# ---------------- Download function ----------------
-def download_universal_video(url, config):
-    download_target_dir = config["download_path"]
-    temp_cookie_path = None
+def _load_cookie_store():
+    try:
+        st = os.stat(COOKIE_PATH)
+    except OSError:
+        return None
+    key = (st.st_mtime_ns, st.st_size)
+    with _cookie_lock:
+        if _cookie_store["key"] == key:
+            return _cookie_store
+        try:
+            with open(COOKIE_PATH, "rb") as f:
+                raw = f.read()
+        except Exception:
+            return None
+        rows = _read_cookie_rows(raw)
+        by_domain = {}
+        for row in rows:
+            by_domain.setdefault(_cookie_row_domain(row), []).append(row)
+        _cookie_store.update({"key": key, "rows": rows, "by_domain": by_domain, "by_host": {}})
+        return _cookie_store
+
+def _cookie_rows_for_host(store, host):
+    labels = host.split(".") if host else []
+    rows = []
+    for i in range(len(labels)):
+        rows.extend(store["by_domain"].get(".".join(labels[i:]), ()))
+    if not rows:
+        for target in COOKIE_REDIRECT_HOSTS.get(host, ()):
+            suffix = "." + target
+            for domain, domain_rows in store["by_domain"].items():
+                if domain == target or domain.endswith(suffix):
+                    rows.extend(domain_rows)
+    return rows
+
+# Netscape text with only the cookies for the URL's host, built once per host and
+# handed to yt-dlp in memory, so no temp file is written per job.
+def cookie_text_for_url(url):
+    store = _load_cookie_store()
+    if not store or not store["rows"]:
+        return None
     try:
-        temp_cookie_path = prepare_clean_cookie_tempfile()
+        host = (urlparse(url).hostname or "").lower().rstrip(".")
+    except ValueError:
+        host = ""
+    with _cookie_lock:
+        if host in store["by_host"]:
+            return store["by_host"][host]
+        rows = _cookie_rows_for_host(store, host)
+        text = "# Netscape HTTP Cookie File\n" + "\n".join(rows) + "\n" if rows else None
+        store["by_host"][host] = text
+        return text
+
+# ---------------- Batch counters ----------------
+_batch_lock = threading.Lock()
+_batch_counters = {}
+
+BATCH_SUMMARY_LABELS = (
+    ("extractions_saved", "Extractor requests saved", str),
+    ("parked", "Links parked (host circuit open)", str),
+    ("archive_skipped", "Already downloaded, skipped", str),
+    ("archive_skipped_bytes", "Size of skipped downloads", format_bytes),
+    ("dedup_files", "Duplicate files linked or dropped", str),
+    ("dedup_bytes", "Space reclaimed by dedup", format_bytes),
+    ("playlist_entries", "Playlist entries queued", str),
+    ("metadata_cache_hits", "Metadata cache hits", str),
+    ("postprocess_jobs", "Conversions run after download", str),
+    ("postprocess_wait", "Conversion queue wait (total)", lambda v: f"{v:.1f}s"),
+    ("postprocess_time", "Conversion time (total)", lambda v: f"{v:.1f}s"),
+    ("remux", "Remuxed to MP4 (stream copy)", str),
+    ("transcode", "Transcoded to MP4", str),
+    ("kept_container", "Kept original container (no FFmpeg)", str),
+    ("cpu_saved", "CPU time saved by remuxing (estimated)", lambda v: f"{v:.1f}s"),
+    ("ffmpeg_cpu", "FFmpeg CPU time (total)", lambda v: f"{v:.1f}s"),
+    ("audio_copied", "Audio kept without re-encoding", str),
+    ("audio_encoded", "Audio encoded to MP3", str),
+    ("thumbnails_converted", "Covers fetched and converted", str),
+    ("thumbnail_cache_hits", "Covers reused from cache", str),
+)
+
+def batch_counters_reset():
+    with _batch_lock:
+        _batch_counters.clear()
+
+def batch_counter_add(key, n=1):
+    with _batch_lock:
+        _batch_counters[key] = _batch_counters.get(key, 0) + n
+
+def print_batch_summary():
+    with _batch_lock:
+        snapshot = dict(_batch_counters)
+    lines = []
+    for key, label, fmt in BATCH_SUMMARY_LABELS:
+        if snapshot.get(key):
+            lines.append(f"      - {label}: {fmt(snapshot[key])}")
+    if not lines:
+        return
+    print(f"{Colors.CYAN}    - Batch summary{Colors.RESET}")
+    for line in lines:
+        print(f"{Colors.CYAN}{line}{Colors.RESET}")
+
+# ---------------- Bandwidth limiter ----------------
+# Process-wide token bucket shared by every download and fragment thread.
+# Progress hooks debit the bytes they report and sleep off any deficit, so
+# the aggregate rate holds however many jobs run; a finishing job simply
+# stops drawing tokens and the remaining jobs absorb its share.
+class BandwidthLimiter:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.rate = 0
+        self.tokens = 0.0
+        self.stamp = time.monotonic()
+        self.active = 0
+
+    def set_rate(self, rate_bps):
+        rate_bps = max(0, int(rate_bps or 0))
+        with self.lock:
+            if rate_bps == self.rate:
+                return
+            self.rate = rate_bps
+            self.tokens = 0.0
+            self.stamp = time.monotonic()
+
+    def job_started(self):
+        with self.lock:
+            self.active += 1
+
+    def job_finished(self):
+        with self.lock:
+            self.active = max(0, self.active - 1)
+
+    def _share(self):
+        return self.rate / max(1, self.active)
+
+    def fair_share(self):
+        with self.lock:
+            return self._share() if self.rate else 0
+
+    def consume(self, nbytes, meter=None):
+        if nbytes <= 0:
+            return
+        with self.lock:
+            if not self.rate:
+                return
+            now = time.monotonic()
+            burst = self.rate * 0.25
+            self.tokens = min(burst, self.tokens + (now - self.stamp) * self.rate)
+            self.stamp = now
+            self.tokens -= nbytes
+            wait = (-self.tokens / self.rate) if self.tokens < 0 else 0.0
+            if meter is not None:
+                # Each job also drains its own bucket at rate / active jobs so a
+                # job reading bigger blocks cannot crowd out the others.
+                share = self._share()
+                meter.tokens = min(share * 0.25, meter.tokens + (now - meter.stamp) * share)
+                meter.stamp = now
+                meter.tokens -= nbytes
+                if meter.tokens < 0:
+                    wait = max(wait, -meter.tokens / share)
+        if wait > 0:
+            time.sleep(wait)
+
+BANDWIDTH = BandwidthLimiter()
+
+_transfer_lock = threading.Lock()
+_transfer_totals = {"bytes": 0}
+
+def transfer_bytes_total():
+    with _transfer_lock:
+        return _transfer_totals["bytes"]
+
+# Per-job counters written by the progress hooks. The hot path only stores
+# numbers; the dashboard formats them at its own pace.
+class JobMeter:
+    __slots__ = ("last", "bytes", "started", "lock", "tokens", "stamp",
+                 "label", "downloaded", "total", "speed", "eta")
+
+    def __init__(self, label=""):
+        self.last = {}
+        self.bytes = 0
+        self.started = None
+        self.lock = threading.Lock()
+        self.tokens = 0.0
+        self.stamp = time.monotonic()
+        self.label = label
+        self.downloaded = 0
+        self.total = 0
+        self.speed = 0.0
+        self.eta = None
+
+    def hook(self, d):
+        if d.get('status') != 'downloading':
+            return
+        key = d.get('tmpfilename') or d.get('filename') or ""
+        downloaded = int(d.get('downloaded_bytes') or 0)
+        self.downloaded = downloaded
+        self.total = d.get('total_bytes') or d.get('total_bytes_estimate') or 0
+        self.speed = d.get('speed') or 0.0
+        self.eta = d.get('eta')
+        with self.lock:
+            if self.started is None:
+                self.started = time.monotonic()
+            delta = downloaded - self.last.get(key, 0)
+            self.last[key] = downloaded
+            if delta > 0:
+                self.bytes += delta
+        if delta > 0:
+            with _transfer_lock:
+                _transfer_totals["bytes"] += delta
+            BANDWIDTH.consume(delta, self)
+
+    def rate(self):
+        if self.started is None:
+            return 0.0
+        elapsed = time.monotonic() - self.started
+        return (self.bytes / elapsed) if elapsed > 0 else 0.0
+
+# ---------------- Adaptive concurrency ----------------
+ADAPTIVE_INTERVAL = 5.0
+ADAPTIVE_GAIN = 1.05
+
+# Hill-climbs the number of running downloads and the fragment threads given
+# to newly started jobs toward the highest aggregate bytes/s seen by the hooks.
+class ConcurrencyController:
+    def __init__(self, config):
+        self.enabled = bool(config.get("adaptive_concurrency"))
+        self.max_downloads = max(1, min(12, int(config.get("adaptive_max_downloads") or 12)))
+        self.max_fragments = max(1, min(16, int(config.get("adaptive_max_fragments") or 8)))
+        max_conc = int(config.get("max_concurrent_downloads") or 3)
+        self.downloads = max(1, min(self.max_downloads, max_conc))
+        self.fragments = max(1, min(self.max_fragments, 4))
+        self.knob = "downloads"
+        self.direction = 1
+        self.last_rate = None
+        self.last_bytes = transfer_bytes_total()
+        self.last_failures = 0
+        self.last_time = time.monotonic()
+
+    def _other_knob(self):
+        return "fragments" if self.knob == "downloads" else "downloads"
+
+    def _step(self, knob, direction):
+        before = (self.downloads, self.fragments)
+        if knob == "downloads":
+            self.downloads = max(1, min(self.max_downloads, self.downloads + direction))
+        else:
+            self.fragments = max(1, min(self.max_fragments, self.fragments + direction))
+        return before != (self.downloads, self.fragments)
+
+    def _climb(self):
+        if not self._step(self.knob, self.direction):
+            self.knob = self._other_knob()
+            self._step(self.knob, self.direction)
+
+    def sample(self, failures, busy):
+        now = time.monotonic()
+        total = transfer_bytes_total()
+        rate = (total - self.last_bytes) / max(0.001, now - self.last_time)
+        new_failures = failures - self.last_failures
+        self.last_bytes, self.last_time, self.last_failures = total, now, failures
+        if not busy:
+            return None
+        before = (self.downloads, self.fragments)
+        if new_failures > 0:
+            reason = f"{new_failures} failure(s), backing off"
+            self.downloads = max(1, self.downloads - 1)
+            self.fragments = max(1, self.fragments // 2)
+            self.direction = -1
+        elif self.last_rate is None:
+            reason = "probing"
+            self._climb()
+        elif rate > self.last_rate * ADAPTIVE_GAIN:
+            reason = "throughput up"
+            self._climb()
+        elif rate * ADAPTIVE_GAIN < self.last_rate:
+            reason = "throughput down, reverting last step"
+            self._step(self.knob, -self.direction)
+            self.knob = self._other_knob()
+            self.direction = -self.direction
+        else:
+            reason = "plateau, backing off"
+            self.direction = -1
+            self._climb()
+        self.last_rate = rate
+        after = (self.downloads, self.fragments)
+        if after == before:
+            return None
+        return (f"[auto] downloads {before[0]} -> {after[0]}, fragments {before[1]} -> {after[1]} "
+                f"at {format_bytes(rate)}/s ({reason})")
+
+# ---------------- Post-processing stage ----------------
+# The download call runs without the conversion postprocessors; this PP keeps a
+# copy of the info dict so conversion can run afterwards (inside a batch, on the
+# post-processing pool once the download slot has been released).
+POSTPROCESS_WORKERS = max(1, os.cpu_count() or 1)
+# Codecs that can be stream-copied into MP4 and still play in common players.
+MP4_COPY_VIDEO_CODECS = frozenset({"avc1", "avc3", "h264", "hev1", "hvc1", "hevc", "h265", "av01", "av1"})
+MP4_COPY_AUDIO_CODECS = frozenset({"mp4a", "aac", "mp3", "ac-3", "ac3", "ec-3", "eac3"})
+# CPU seconds per second of media assumed for a transcode until one has been measured.
+TRANSCODE_CPU_PER_MEDIA_SECOND = 2.0
+
+_transcode_lock = threading.Lock()
+_transcode_cost = {"cpu": 0.0, "media": 0.0}
+
+# Splits the machine's cores between the ffmpeg processes that are running: each
+# invocation gets cpu_count / active conversions threads when it is launched.
+class FFmpegThreadBudget:
+    def __init__(self, total=None):
+        self.total = max(1, total or os.cpu_count() or 1)
+        self.active = 0
+        self.lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def lease(self):
+        with self.lock:
+            self.active += 1
+            threads = max(1, self.total // self.active)
+        try:
+            yield threads
+        finally:
+            with self.lock:
+                self.active -= 1
 
-        ydl_opts_info = {
-            'quiet': True,
-            'no_warnings': True,
-            'noprogress': True,
-            'skip_download': True,
-            'logger': QuietLogger(),
-            'extractor_args': {'generic': ['impersonate']},
-        }
-        rate_bps = int(config.get("max_download_rate_bps") or 0)
-        if rate_bps > 0:
-            ydl_opts_info['ratelimit'] = rate_bps
-        if temp_cookie_path and os.path.exists(temp_cookie_path):
-            ydl_opts_info['cookiefile'] = temp_cookie_path
+FFMPEG_THREADS = FFmpegThreadBudget()
 
+def _windows_process_cpu(handle):
+    try:
+        import ctypes
+        from ctypes import wintypes
+        times = [wintypes.FILETIME() for _ in range(4)]
+        if not ctypes.windll.kernel32.GetProcessTimes(wintypes.HANDLE(int(handle)), *(ctypes.byref(t) for t in times)):
+            return None
+    except (ImportError, AttributeError, OSError):
+        return None
+    # FILETIME counts 100 ns ticks; the last two are kernel and user time.
+    return sum(((t.dwHighDateTime << 32) | t.dwLowDateTime) / 1e7 for t in times[2:])
+
+# Runs one ffmpeg/ffprobe command and measures the child's own CPU time even while
+# other conversions run: wait4 on POSIX, GetProcessTimes on Windows. The CPU time
+# is None where neither is available.
+def run_ffmpeg(args):
+    cpu = None
+    with tempfile.TemporaryFile() as err_file:
+        proc = subprocess.Popen(args, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=err_file)
+        out = proc.stdout.read()
+        proc.stdout.close()
+        if hasattr(os, "wait4"):
+            _, status, usage = os.wait4(proc.pid, 0)
+            proc.returncode = os.waitstatus_to_exitcode(status)
+            cpu = usage.ru_utime + usage.ru_stime
+        else:
+            proc.wait()
+            if os.name == "nt":
+                cpu = _windows_process_cpu(proc._handle)
+        err_file.seek(0)
+        err = err_file.read()
+    return proc.returncode, out.decode("utf-8", "replace"), err.decode("utf-8", "replace"), cpu
+
+def _codec_family(codec):
+    return str(codec).split(".")[0].lower()
+
+def _info_codecs(info):
+    video, audio = [], []
+    for f in info.get("requested_formats") or [info]:
+        vcodec, acodec = f.get("vcodec"), f.get("acodec")
+        if vcodec is None or acodec is None:
+            return None
+        if vcodec != "none":
+            video.append(_codec_family(vcodec))
+        if acodec != "none":
+            audio.append(_codec_family(acodec))
+    return video, audio
+
+def probe_media(path):
+    ff = probe_ffmpeg()
+    if not ff:
+        return None
+    ffprobe = shutil.which("ffprobe", path=os.path.dirname(ff["path"])) or shutil.which("ffprobe")
+    if not ffprobe:
+        return None
+    try:
+        rc, out, _, _ = run_ffmpeg([ffprobe, "-v", "error", "-show_entries",
+                                    "stream=codec_type,codec_name:format=duration", "-of", "json", path])
+        data = json.loads(out) if rc == 0 else None
+    except (OSError, ValueError):
+        data = None
+    if not data:
+        return None
+    video = [_codec_family(st.get("codec_name")) for st in data.get("streams", []) if st.get("codec_type") == "video"]
+    audio = [_codec_family(st.get("codec_name")) for st in data.get("streams", []) if st.get("codec_type") == "audio"]
+    try:
+        duration = float((data.get("format") or {}).get("duration") or 0)
+    except ValueError:
+        duration = 0.0
+    return video, audio, duration
+
+def _estimate_transcode_cpu(media_seconds):
+    with _transcode_lock:
+        if _transcode_cost["media"] > 0:
+            rate = _transcode_cost["cpu"] / _transcode_cost["media"]
+        else:
+            rate = TRANSCODE_CPU_PER_MEDIA_SECOND
+    return media_seconds * rate
+
+def _fits_mp4(codecs):
+    video, audio = codecs
+    return (all(c in MP4_COPY_VIDEO_CODECS for c in video)
+            and all(c in MP4_COPY_AUDIO_CODECS for c in audio))
+
+# Converts a finished video download to MP4: remux (stream copy) when the codecs
+# fit the container, a full transcode only when they do not.
+def convert_video_to_mp4(src, info, duration=0):
+    from yt_dlp.utils import PostProcessingError
+    result = {"route": "keep", "path": src, "cpu": 0.0, "saved": 0.0, "threads": 0}
+    if os.path.splitext(src)[1].lower() == ".mp4":
+        return result
+    ff = probe_ffmpeg()
+    if not ff:
+        result["route"] = "kept"
+        return result
+    media = float(duration or 0)
+    codecs = _info_codecs(info)
+    if codecs is None or not media:
+        probed = probe_media(src)
+        if probed:
+            codecs = codecs or probed[:2]
+            media = media or probed[2]
+    root = os.path.splitext(src)[0]
+    target = root + ".mp4"
+    temp = root + ".temp.mp4"
+    head = [ff["path"], "-y", "-loglevel", "error", "-i", src, "-map", "0", "-dn", "-ignore_unknown"]
+    tail = ["-movflags", "+faststart", temp]
+    if codecs and ff["stream_copy"] and _fits_mp4(codecs):
+        with FFMPEG_THREADS.lease() as threads:
+            rc, _, _, cpu = run_ffmpeg(head + ["-c", "copy", "-threads", str(threads)] + tail)
+        if rc == 0:
+            os.replace(temp, target)
+            os.remove(src)
+            saved = max(0.0, _estimate_transcode_cpu(media) - cpu) if cpu is not None else None
+            result.update(route="remux", path=target, cpu=cpu, threads=threads, saved=saved)
+            return result
+    with FFMPEG_THREADS.lease() as threads:
+        rc, _, err, cpu = run_ffmpeg(head + ["-threads", str(threads)] + tail)
+    if rc != 0:
         try:
-            with yt_dlp.YoutubeDL(ydl_opts_info) as ydl:
-                info_dict = ydl.extract_info(url, download=False)
-                title = info_dict.get("title", "video")
-                ext = info_dict.get("ext", "mp4")
-                duration_seconds = int(info_dict.get("duration") or 0)
-        except Exception as e:
-            return False, f"Could not fetch video info: {e}", 0, 0
+            os.remove(temp)
+        except OSError:
+            pass
+        lines = err.strip().splitlines()
+        raise PostProcessingError(lines[-1] if lines else "ffmpeg conversion failed")
+    os.replace(temp, target)
+    os.remove(src)
+    if cpu is not None and media > 0:
+        with _transcode_lock:
+            _transcode_cost["cpu"] += cpu
+            _transcode_cost["media"] += media
+    result.update(route="transcode", path=target, cpu=cpu, threads=threads)
+    return result
+
+# Audio-only extraction. "mp3" always ends in MP3 (copying an MP3 stream, like
+# yt-dlp's FFmpegExtractAudio); "smart" stream-copies codecs listed in
+# audio_accept_codecs; "copy" stream-copies anything with a known container.
+AUDIO_POLICIES = ("mp3", "smart", "copy")
+AUDIO_ACCEPT_CODECS = ("mp3", "aac", "opus")
+AUDIO_COPY_CONTAINERS = {"mp3": "mp3", "aac": "m4a", "alac": "m4a", "opus": "opus", "vorbis": "ogg", "flac": "flac"}
+# yt-dlp reports AAC by its RFC 6381 name ("mp4a.40.2"); ffprobe calls it "aac".
+AUDIO_CODEC_ALIASES = {"mp4a": "aac"}
+# Containers EmbedThumbnail can write a cover to; the Vorbis-comment ones need mutagen.
+COVER_CONTAINERS = ("mp3", "m4a")
+COVER_CONTAINERS_MUTAGEN = ("opus", "ogg", "flac")
+
+def audio_policy(config):
+    policy = str(config.get("audio_policy") or "mp3").lower()
+    return policy if policy in AUDIO_POLICIES else "mp3"
+
+def _format_bitrate(f):
+    return f.get('abr') or f.get('tbr') or 0
+
+def audio_format_selector(config):
+    kbps = int(config.get("audio_target_kbps") or 0)
+    if kbps <= 0:
+        return 'bestaudio/best'
+
+    # Smallest stream (by size, then bitrate) that still meets the target, else
+    # the usual best. A format string cannot express this: yt-dlp ranks acodec
+    # before size, and a global format_sort would also change the fallback.
+    def select(ctx):
+        formats = ctx['formats']
+        audio = [f for f in formats if f.get('acodec') != 'none' and f.get('vcodec') in (None, 'none')]
+        fit = [f for f in audio if _format_bitrate(f) >= kbps]
+        if fit:
+            yield min(fit, key=lambda f: (f.get('filesize') or f.get('filesize_approx') or float('inf'), _format_bitrate(f)))
+        elif audio:
+            yield audio[-1]
+        elif formats:
+            yield formats[-1]
+    return select
+
+def cover_supported(ext):
+    if ext in COVER_CONTAINERS:
+        return True
+    return ext in COVER_CONTAINERS_MUTAGEN and importlib.util.find_spec("mutagen") is not None
+
+def _audio_codec(info, src):
+    # The codec yt-dlp already reported, ffprobe only when it did not say.
+    acodec = (info or {}).get("acodec")
+    if acodec and acodec != "none":
+        family = _codec_family(acodec)
+        return AUDIO_CODEC_ALIASES.get(family, family)
+    probed = probe_media(src)
+    return probed[1][0] if probed and probed[1] else None
+
+def extract_audio(src, policy="mp3", accept=(), info=None):
+    from yt_dlp.utils import PostProcessingError
+    result = {"route": "keep", "path": src, "cpu": 0.0, "saved": 0.0, "threads": 0, "codec": None}
+    ff = probe_ffmpeg()
+    if not ff:
+        raise PostProcessingError("FFmpeg not found.")
+    root, ext = os.path.splitext(src)
+    codec = _audio_codec(info, src)
+    result["codec"] = codec
+    if policy == "copy":
+        copy = codec in AUDIO_COPY_CONTAINERS
+    elif policy == "smart":
+        copy = codec in AUDIO_COPY_CONTAINERS and codec in accept
+    else:
+        copy = codec == "mp3"
+    if not copy and not ffmpeg_has_encoder("libmp3lame"):
+        raise PostProcessingError("FFmpeg was built without the MP3 encoder (libmp3lame).")
+    target_ext = AUDIO_COPY_CONTAINERS[codec] if copy else "mp3"
+    if copy and ext.lower() == "." + target_ext:
+        return result
+    target = f"{root}.{target_ext}"
+    temp = f"{root}.temp.{target_ext}"
+    with FFMPEG_THREADS.lease() as threads:
+        rc, _, err, cpu = run_ffmpeg([
+            ff["path"], "-y", "-loglevel", "error", "-i", src, "-vn", "-sn", "-dn",
+            "-acodec", "copy" if copy else "libmp3lame", "-threads", str(threads), temp,
+        ])
+    if rc != 0:
+        try:
+            os.remove(temp)
+        except OSError:
+            pass
+        lines = err.strip().splitlines()
+        raise PostProcessingError(lines[-1] if lines else "audio conversion failed")
+    os.replace(temp, target)
+    if os.path.abspath(src) != os.path.abspath(target):
+        os.remove(src)
+    result.update(route="copy" if copy else "mp3", path=target, cpu=cpu, threads=threads)
+    return result
+
+def describe_conversion(route):
+    kind = route["route"]
+    threads = route.get("threads", 0)
+    cpu = f"{route['cpu']:.1f}s" if route["cpu"] is not None else "n/a"
+    usage = f"{threads} thread{'' if threads == 1 else 's'}, {cpu} CPU"
+    if kind == "remux":
+        if route["saved"] is None:
+            return f"MP4: remuxed (stream copy, {usage})"
+        return f"MP4: remuxed (stream copy, {usage}, ~{route['saved']:.1f}s CPU saved)"
+    if kind == "transcode":
+        return f"MP4: transcoded ({usage})"
+    if kind == "kept":
+        return "MP4: kept original container (FFmpeg not found)"
+    if kind == "mp3":
+        return f"MP3: encoded ({usage})"
+    if kind == "copy":
+        ext = os.path.splitext(route["path"])[1].lstrip(".").upper()
+        return f"Audio: {route.get('codec') or 'original'} stream kept as {ext} ({usage})"
+    return None
 
-        safe_title = sanitize_filename(title)
-        rand_id = _random_digits(4, 8)
-        base_name = f"{safe_title}_{rand_id}"
-        final_path = get_unique_filename(download_target_dir, base_name, ext)
-        base_no_ext = os.path.splitext(final_path)[0]
+# Defined on first use so importing this module does not import yt-dlp.
+_capture_pp_class = []
+
+def capture_info_pp():
+    if not _capture_pp_class:
+        from yt_dlp.postprocessor import PostProcessor
+
+        class _CaptureInfoPP(PostProcessor):
+            def __init__(self, downloader=None):
+                super().__init__(downloader)
+                self.info = None
+                self.started = 0.0
+
+            def run(self, info):
+                captured = dict(info)
+                captured['__files_to_move'] = dict(info.get('__files_to_move') or {})
+                self.info = captured
+                return [], info
+
+        _capture_pp_class.append(_CaptureInfoPP)
+    return _capture_pp_class[0]()
+
+# Cover art for EmbedThumbnail, fetched and converted to JPEG once per distinct
+# image. Thumbnail URLs map to the hash of the fetched bytes, and each hash to one
+# converted JPEG under THUMBNAIL_CACHE_DIR, evicted least recently used first.
+THUMBNAIL_CACHE_DIR = os.path.join(BASE_DIR, ".universal_thumbs")
+THUMBNAIL_CACHE_PRUNE_EVERY = 50
+THUMBNAIL_LOCK_STRIPES = 64
+
+register_db_schema("""
+CREATE TABLE IF NOT EXISTS thumbnail_urls (
+    url TEXT PRIMARY KEY,
+    digest TEXT NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS thumbnail_files (
+    digest TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    used INTEGER NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS thumbnail_files_used ON thumbnail_files (used);
+""")
+
+_thumbnail_locks = [threading.Lock() for _ in range(THUMBNAIL_LOCK_STRIPES)]
+_thumbnail_writes = {"n": 0}
+
+def thumbnail_cache_enabled(config):
+    return float(config.get("thumbnail_cache_max_mb") or 0) > 0
+
+def _thumbnail_path(digest):
+    return os.path.join(THUMBNAIL_CACHE_DIR, f"{digest}.jpg")
+
+def _thumbnail_lookup(url):
+    try:
+        row = db_connect().execute("SELECT digest FROM thumbnail_urls WHERE url = ?", (url,)).fetchone()
+        if not row or not os.path.exists(_thumbnail_path(row[0])):
+            return None
+        with db_write() as conn:
+            conn.execute("UPDATE thumbnail_files SET used = ? WHERE digest = ?", (time.time_ns() // 1000000, row[0]))
+        return _thumbnail_path(row[0])
+    except sqlite3.Error:
+        return None
 
-        prog = {'len': 0, 't': 0.0, 'pct': -1.0, 'delta': 1.0, 'started': False}
+def _thumbnail_to_jpeg(data, digest):
+    from yt_dlp.utils import PostProcessingError
+    os.makedirs(THUMBNAIL_CACHE_DIR, exist_ok=True)
+    target = _thumbnail_path(digest)
+    temp = f"{target}.{threading.get_ident()}.part"
+    if data[:3] == b"\xff\xd8\xff":
+        with open(temp, "wb") as f:
+            f.write(data)
+    else:
+        ff = probe_ffmpeg()
+        if not ff:
+            raise PostProcessingError("FFmpeg not found.")
+        raw = f"{target}.{threading.get_ident()}.src"
+        with open(raw, "wb") as f:
+            f.write(data)
+        try:
+            rc, _, err, _ = run_ffmpeg([ff["path"], "-y", "-loglevel", "error", "-i", raw,
+                                        "-frames:v", "1", "-f", "image2", "-c:v", "mjpeg", temp])
+        finally:
+            os.remove(raw)
+        if rc != 0:
+            with contextlib.suppress(OSError):
+                os.remove(temp)
+            lines = err.strip().splitlines()
+            raise PostProcessingError(lines[-1] if lines else "thumbnail conversion failed")
+    os.replace(temp, target)
+    return os.path.getsize(target)
+
+def _prune_thumbnail_cache(conn, config, keep):
+    limit = int(float(config.get("thumbnail_cache_max_mb") or 0) * 1024 * 1024)
+    total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM thumbnail_files").fetchone()[0]
+    if total <= limit:
+        return
+    doomed = []
+    for digest, size in conn.execute("SELECT digest, size FROM thumbnail_files ORDER BY used"):
+        if total <= limit:
+            break
+        if digest == keep:
+            continue
+        doomed.append((digest,))
+        total -= size
+    conn.executemany("DELETE FROM thumbnail_files WHERE digest = ?", doomed)
+    conn.executemany("DELETE FROM thumbnail_urls WHERE digest = ?", doomed)
+    for (digest,) in doomed:
+        with contextlib.suppress(OSError):
+            os.remove(_thumbnail_path(digest))
+
+def cached_thumbnail(url, fetch, config):
+    # URLs hash onto a fixed set of locks: tracks of an album reach the converters
+    # together and should wait for the first one's fetch instead of repeating it.
+    with _thumbnail_locks[hash(url) % THUMBNAIL_LOCK_STRIPES]:
+        path = _thumbnail_lookup(url)
+        if path:
+            batch_counter_add("thumbnail_cache_hits")
+            return path
+        data = fetch(url)
+        digest = hashlib.blake2b(data, digest_size=16).hexdigest()
+        path = _thumbnail_path(digest)
+        if os.path.exists(path):
+            batch_counter_add("thumbnail_cache_hits")
+            size = os.path.getsize(path)
+        else:
+            size = _thumbnail_to_jpeg(data, digest)
+            batch_counter_add("thumbnails_converted")
+        now = time.time_ns() // 1000000
+        try:
+            with db_write() as conn:
+                conn.execute("INSERT OR REPLACE INTO thumbnail_urls (url, digest) VALUES (?, ?)", (url, digest))
+                conn.execute(
+                    "INSERT OR REPLACE INTO thumbnail_files (digest, size, used) VALUES (?, ?, ?)",
+                    (digest, size, now)
+                )
+                _thumbnail_writes["n"] += 1
+                if _thumbnail_writes["n"] % THUMBNAIL_CACHE_PRUNE_EVERY == 0:
+                    _prune_thumbnail_cache(conn, config, digest)
+        except sqlite3.Error:
+            pass
+        return path
 
-        def write_progress(line):
-            now = time.time()
-            if (now - prog['t'] < 0.12) and (abs(prog['delta']) < 0.004):
+# ---------------- Download function ----------------
+# Playlists are read flat (entries stay unresolved url results) and each entry is
+# handed to the batch as its own job instead of downloading inside one slot.
+PLAYLIST_PAGE_SIZE = 50
+PLAYLIST_EXPAND_WORKERS = 2
+PLAYLIST_MAX_REDIRECTS = 3
+
+def _resolve_url_result(ydl, info):
+    hops = 0
+    while info and info.get('_type') == 'url' and hops < PLAYLIST_MAX_REDIRECTS:
+        info = ydl.extract_info(info['url'], download=False, process=False, ie_key=info.get('ie_key'))
+        hops += 1
+    return info
+
+def _iter_playlist_entries(entries):
+    if hasattr(entries, "getslice"):
+        start = 0
+        while True:
+            page = entries.getslice(start, start + PLAYLIST_PAGE_SIZE)
+            yield from page
+            if len(page) < PLAYLIST_PAGE_SIZE:
                 return
-            prog['t'] = now
-            vis = visible_len(line)
-            pad = max(0, prog['len'] - vis)
-            try:
-                sys.stdout.write('\r' + line + (' ' * pad))
-                sys.stdout.flush()
-                prog['len'] = max(prog['len'], vis)
-            except:
-                pass
-
-        def clear_progress():
-            if prog['len'] > 0:
-                try:
-                    sys.stdout.write('\r' + (' ' * prog['len']) + '\r')
-                    sys.stdout.flush()
-                except:
-                    pass
-                prog['len'] = 0
+            start += len(page)
+    elif entries:
+        yield from entries
 
-        def progress_hook(d):
-            status = d.get('status')
-            if status == 'downloading':
-                if not prog['started']:
-                    print("")
-                    prog['started'] = True
-                total = d.get('total_bytes') or d.get('total_bytes_estimate') or 0
-                downloaded = d.get('downloaded_bytes', 0)
-                pct = (downloaded / total) if total else 0.0
-                prog['delta'] = (pct - prog['pct']) if prog['pct'] >= 0 else 1.0
-                prog['pct'] = pct
-                bar = make_bar(pct, 34)
-                spd = d.get('speed') or 0
-                speed_str = f"{format_bytes(spd)}/s" if spd else "--/s"
-                eta = d.get('eta')
-                eta_str = format_seconds(eta) if eta is not None else "--:--"
-                dl_str = format_bytes(downloaded)
-                tot_str = format_bytes(total) if total else "?"
-                pct_str = f"{pct*100:5.1f}%"
-                line = f"{bar} {pct_str} {dl_str}/{tot_str} {speed_str:>9} ETA {eta_str}"
-                write_progress(line)
-            elif status == 'finished':
-                clear_progress()
-
-        audio_only = bool(config.get("audio_only"))
-        embed_cover = bool(config.get("embed_mp3_cover", True))
-        multi_mode = bool(config.get("multi_download"))
-        max_conc = int(config.get("max_concurrent_downloads") or 3)
-        conc_frags = max(2, min(8, int(max_conc)))
-
-        if audio_only and not check_ffmpeg():
-            return False, ("FFmpeg required for audio-only and embedding thumbnails."), 0, 0
+def _playlist_entry_url(entry):
+    if not isinstance(entry, dict) or entry.get('_type') not in ('url', 'url_transparent'):
+        return None
+    for key in ('webpage_url', 'url'):
+        value = entry.get(key)
+        if isinstance(value, str) and value.startswith(("http://", "https://")):
+            return value
+    return None
 
-        if not audio_only:
-            ydl_postprocessors = [{'key': 'FFmpegVideoConvertor', 'preferedformat': 'mp4'}]
-            ydl_format = 'bestvideo[ext=mp4]+bestaudio[ext=m4a]/best[ext=mp4]/best'
+def _expand_playlist(job, info, entries, config=None):
+    title = info.get("title") or info.get("id") or "playlist"
+    if job.meter is not None:
+        job.meter.label = f"Expanding {title}"
+    queued = 0
+    urls = []
+    for entry in entries:
+        entry_url = entry if isinstance(entry, str) else _playlist_entry_url(entry)
+        if not entry_url:
+            continue
+        urls.append(entry_url)
+        if job.expand(entry_url):
+            queued += 1
+    if config is not None:
+        metadata_cache_put(job.url, dict(info, entries=urls), config)
+    job.expanded = queued
+    batch_counter_add("playlist_entries", queued)
+    return True, title, 0, 0
+
+def _archive_skip(job, entry):
+    batch_counter_add("archive_skipped")
+    batch_counter_add("archive_skipped_bytes", entry["size"])
+    if job is not None:
+        job.skipped = True
+        job.path = entry["path"]
+    return True, "Already downloaded.", entry["size"], 0
+
+def download_universal_video(url, config, job=None):
+    import yt_dlp
+    from yt_dlp.utils import DownloadError, ExtractorError, PostProcessingError
+    use_archive = bool(config.get("download_archive", True))
+    archive_kind = "audio" if config.get("audio_only") else "video"
+    if use_archive:
+        entry = archive_lookup_url(url, archive_kind)
+        if entry:
+            return _archive_skip(job, entry)
+    cookie_text = cookie_text_for_url(url)
+
+    audio_only = bool(config.get("audio_only"))
+    embed_cover = bool(config.get("embed_mp3_cover", True))
+    max_conc = int(config.get("max_concurrent_downloads") or 3)
+    conc_frags = min(8, max(3, int(max_conc)))
+    if job is not None and job.fragments:
+        conc_frags = job.fragments
+
+    if audio_only and not check_ffmpeg():
+        if job is not None:
+            job.error_class = "postprocess"
+        return False, ("FFmpeg required for audio-only and embedding thumbnails."), 0, 0
+
+    if not audio_only:
+        ydl_postprocessors = []
+        ydl_format = 'bestvideo[ext=mp4]+bestaudio[ext=m4a]/best[ext=mp4]/best'
+    else:
+        ydl_postprocessors = []
+        if embed_cover and thumbnail_cache_enabled(config):
+            # The cover comes from the thumbnail cache already converted to JPEG.
+            ydl_postprocessors += [{'key': 'EmbedThumbnail'}]
+        elif embed_cover:
+            ydl_postprocessors += [
+                {'key': 'FFmpegThumbnailsConvertor', 'format': 'jpg'},
+                {'key': 'EmbedThumbnail'}
+            ]
+        ydl_format = audio_format_selector(config)
+
+    # Resolve the URL once; the same info_dict drives naming and the download.
+    ydl_opts_info = {
+        'format': ydl_format,
+        'quiet': True,
+        'no_warnings': True,
+        'noprogress': True,
+        'skip_download': True,
+        'logger': QuietLogger(),
+        'extractor_args': {'generic': ['impersonate']},
+    }
+    if cookie_text:
+        ydl_opts_info['cookiefile'] = io.StringIO(cookie_text)
+
+    cached = metadata_cache_get(url, config)
+    if cached and cached.get("_type") == "playlist":
+        if job is not None and job.expand is not None:
+            batch_counter_add("metadata_cache_hits")
+            job.pending_expand = functools.partial(_expand_playlist, job, cached, cached.get("entries") or ())
+            return True, "", 0, 0
+        cached = None
+    try:
+        if cached:
+            # Cache hit: name and admit from the cached fields, resolve media URLs at download time.
+            batch_counter_add("metadata_cache_hits")
+            info_dict = cached
+            title = cached.get("title") or "video"
+            ext = "mp3" if audio_only else "mp4"
+            duration_seconds = int(cached.get("duration") or 0)
+            resolved_info = None
         else:
-            ydl_postprocessors = [{'key': 'FFmpegExtractAudio', 'preferredcodec': 'mp3'}]
-            if embed_cover:
-                ydl_postprocessors += [
-                    {'key': 'FFmpegThumbnailsConvertor', 'format': 'jpg'},
-                    {'key': 'EmbedThumbnail'}
-                ]
-            ydl_format = 'bestaudio/best'
-
-        postprocessor_args = {}
+            with yt_dlp.YoutubeDL(ydl_opts_info) as ydl:
+                raw_info = _resolve_url_result(ydl, ydl.extract_info(url, download=False, process=False))
+                if raw_info.get('_type') == 'playlist' and job is not None and job.expand is not None:
+                    entries = _iter_playlist_entries(raw_info.get('entries'))
+                    first = next(entries, None)
+                    if _playlist_entry_url(first):
+                        # Queued from the expansion pool once the batch has freed this job's slot.
+                        # Reopening the instance is fine: yt-dlp recreates its handlers after close().
+                        def expand():
+                            with ydl:
+                                return _expand_playlist(job, raw_info, chain([first], entries), config)
+                        job.pending_expand = expand
+                        return True, "", 0, 0
+                    # Entries the extractor already resolved (e.g. several <video> tags on one
+                    # page) are not expanded; the page stays one job, downloaded as before.
+                    raw_info['entries'] = [] if first is None else chain([first], entries)
+                info_dict = ydl.process_ie_result(raw_info, download=False)
+                title = info_dict.get("title", "video")
+                ext = info_dict.get("ext", "mp4")
+                duration_seconds = int(info_dict.get("duration") or 0)
+                if info_dict.get("_type", "video") == "video":
+                    resolved_info = ydl.sanitize_info(info_dict, remove_private_keys=True)
+                else:
+                    # remove_private_keys drops "entries"; playlists are extracted again by the download pass.
+                    resolved_info = None
+            if info_dict.get("_type", "video") == "video":
+                metadata_cache_put(url, info_dict, config)
+    except Exception as e:
+        record_download_failure(url)
+        if job is not None:
+            job.error_class = _error_class(str(e))
+        return False, f"Could not fetch video info: {e}", 0, 0
+
+    extractor_key = info_dict.get("extractor_key") or info_dict.get("extractor")
+    video_id = info_dict.get("id")
+    if extractor_key == "Generic":
+        # Generic ids are just the file name (often "video" or "index"); key on the page instead.
+        video_id = info_dict.get("webpage_url") or url
+    if use_archive:
+        entry = archive_lookup_id(extractor_key, video_id, archive_kind)
+        if entry:
+            archive_add(url, extractor_key, video_id, archive_kind)
+            return _archive_skip(job, entry)
+
+    safe_title = sanitize_filename(title)
+    rand_id = _random_digits(4, 8)
+    base_name = f"{safe_title}_{rand_id}"
+    final_path = get_unique_filename(output_directory(config, base_name), base_name, ext)
+    base_no_ext = os.path.splitext(final_path)[0]
+
+    # yt-dlp matches these keys against the lower-cased PP key.
+    postprocessor_args = {}
+    if audio_only and embed_cover:
+        postprocessor_args['embedthumbnail'] = ['-loglevel', 'error']
+        postprocessor_args['thumbnailsconvertor'] = ['-loglevel', 'error']
+
+    ydl_opts = {
+        'format': ydl_format,
+        'outtmpl': base_no_ext + ".%(ext)s",
+        'quiet': True,
+        'no_warnings': True,
+        'noprogress': True,
+        'logger': QuietLogger(),
+        'extractor_args': {'generic': ['impersonate']},
+        'concurrent_fragment_downloads': conc_frags,
+        'http_chunk_size': 16 * 1024 * 1024,
+        'retries': 10,
+        'fragment_retries': 10,
+        'socket_timeout': 30,
+        'post_overwrites': True,
+        'prefer_ffmpeg': True,
+        'postprocessor_args': postprocessor_args,
+    }
+    BANDWIDTH.set_rate(config.get("max_download_rate_bps"))
+    meter = job.meter if job is not None and job.meter is not None else JobMeter()
+    meter.label = title
+    ydl_opts['progress_hooks'] = [meter.hook]
+    dedupe_mode = str(config.get("dedupe_mode") or "off").lower()
+    hasher = StreamHasher() if dedupe_mode in ("hardlink", "drop") else None
+    if hasher:
+        ydl_opts['progress_hooks'].append(hasher.hook)
+    if audio_only and embed_cover and not thumbnail_cache_enabled(config):
+        ydl_opts['writethumbnail'] = True
+
+    def find_final_output(base_root):
+        exts = ["mp4", "webm", "mkv", "mov", "m4a", "mp3", "opus", "ogg", "flac"]
+        for e in exts:
+            p = f"{base_root}.{e}"
+            if os.path.exists(p):
+                return p
+        return base_root + ".mp4"
+
+    def cleanup_thumbnails(base_root):
+        for e in ("jpg", "jpeg", "png", "webp"):
+            p = f"{base_root}.{e}"
+            try:
+                if os.path.exists(p):
+                    os.remove(p)
+            except Exception:
+                pass
+
+    def conclude_output(start_time):
+        final_effective = find_final_output(base_no_ext)
+        if not os.path.exists(final_effective):
+            return False, None, "Output file not found.", 0, 0
         if audio_only:
-            postprocessor_args['FFmpegExtractAudio'] = ['-vn', '-sn', '-dn', '-loglevel', 'error', '-threads', '2']
-            if embed_cover:
-                postprocessor_args['EmbedThumbnail'] = ['-loglevel', 'error']
-        else:
-            postprocessor_args['FFmpegVideoConvertor'] = ['-loglevel', 'error', '-threads', '2']
+            cleanup_thumbnails(base_no_ext)
+        return finalize_success_record(final_effective, start_time)
+
+    def attempt_failure(e, start_time):
+        if isinstance(e, PostProcessingError):
+            final_effective = find_final_output(base_no_ext)
+            if audio_only and os.path.exists(final_effective):
+                cleanup_thumbnails(base_no_ext)
+                return finalize_success_record(final_effective, start_time)
+            return False, None, "Post-processing failed.", 0, 0
+        if isinstance(e, OSError):
+            if getattr(e, "errno", None) == errno.ENOSPC:
+                return False, None, "No space left on device.", 0, 0
+            return False, None, f"File system error: {e}", 0, 0
+        if isinstance(e, (DownloadError, ExtractorError)):
+            return False, None, _friendly_protection_message(str(e)), 0, 0
+        return False, None, f"Unexpected: {type(e).__name__} - {e}", 0, 0
+
+    def finalize_success_record(final_effective, start_time):
+        end_time = time.time()
+        download_duration = end_time - start_time
+        file_size = os.path.getsize(final_effective)
+        try:
+            record_download_stat(file_size, url=url, duration=download_duration)
+        except Exception:
+            pass
+        return True, final_effective, "", file_size, download_duration
+
+    def attempt_download(info, capture):
+        opts = ydl_opts.copy()
+        if cookie_text:
+            # yt-dlp reads (and on close rewrites) the jar; each instance gets its own copy.
+            opts['cookiefile'] = io.StringIO(cookie_text)
+        start_time = time.time()
+        try:
+            with yt_dlp.YoutubeDL(opts) as ydl:
+                capture.started = start_time
+                ydl.add_post_processor(capture, when='post_process')
+                if info is None:
+                    ydl.extract_info(url, download=True)
+                else:
+                    batch_counter_add("extractions_saved")
+                    ydl.process_ie_result(info, download=True)
+            if capture.info is None or not os.path.exists(capture.info.get('filepath') or ""):
+                return False, None, "Output file not found.", 0, 0
+            return True, None, "", 0, 0
+        except Exception as e:
+            return attempt_failure(e, start_time)
 
-        ydl_opts = {
-            'format': ydl_format,
-            'outtmpl': base_no_ext + ".%(ext)s",
-            'postprocessors': ydl_postprocessors,
+    def attach_cached_cover(ydl, captured):
+        thumb_url = captured.get('thumbnail')
+        if not thumb_url:
+            return
+        target = f"{base_no_ext}.jpg"
+        try:
+            cover = cached_thumbnail(thumb_url, lambda u: ydl.urlopen(u).read(), config)
+            try:
+                os.link(cover, target)
+            except OSError:
+                shutil.copyfile(cover, target)
+        except Exception:
+            # A missing cover is not worth failing the track for, as with writethumbnail.
+            return
+        captured['thumbnails'] = [{'id': '0', 'url': thumb_url, 'filepath': target}]
+
+    def run_postprocessors(captured, start_time):
+        pp_opts = {
             'quiet': True,
             'no_warnings': True,
-            'noprogress': True,
             'logger': QuietLogger(),
-            'extractor_args': {'generic': ['impersonate']},
-            'concurrent_fragment_downloads': min(8, max(3, conc_frags)),
-            'http_chunk_size': 16 * 1024 * 1024,
-            'retries': 10,
-            'fragment_retries': 10,
-            'socket_timeout': 30,
+            'postprocessors': ydl_postprocessors,
+            'postprocessor_args': postprocessor_args,
             'post_overwrites': True,
             'prefer_ffmpeg': True,
-            'postprocessor_args': postprocessor_args,
         }
-        if not multi_mode:
-            ydl_opts['progress_hooks'] = [progress_hook]
-        if audio_only and embed_cover:
-            ydl_opts['writethumbnail'] = True
-        if rate_bps := int(config.get("max_download_rate_bps") or 0):
-            ydl_opts['ratelimit'] = rate_bps
-        if temp_cookie_path and os.path.exists(temp_cookie_path):
-            ydl_opts['cookiefile'] = temp_cookie_path
-
-        def find_final_output(base_root):
-            exts = ["mp4", "webm", "mkv", "mov", "m4a", "mp3"]
-            for e in exts:
-                p = f"{base_root}.{e}"
-                if os.path.exists(p):
-                    return p
-            return base_root + ".mp4"
-
-        def cleanup_thumbnails(base_root):
-            for e in ("jpg", "jpeg", "png", "webp"):
-                p = f"{base_root}.{e}"
-                try:
-                    if os.path.exists(p):
-                        os.remove(p)
-                except Exception:
-                    pass
-
-        def finalize_success_record(final_effective, start_time):
-            end_time = time.time()
-            download_duration = end_time - start_time
-            file_size = os.path.getsize(final_effective)
-            try:
-                record_download_stat(file_size)
-            except Exception:
-                pass
-            return True, final_effective, "", file_size, download_duration
-
-        def attempt_download(url_dl):
-            opts = ydl_opts.copy()
-            start_time = time.time()
-            try:
-                with yt_dlp.YoutubeDL(opts) as ydl:
-                    ydl.extract_info(url_dl, download=True)
-                clear_progress()
-                final_effective = find_final_output(base_no_ext)
-                if not os.path.exists(final_effective):
-                    return False, None, "Output file not found.", 0, 0
-                if audio_only:
-                    cleanup_thumbnails(base_no_ext)
-                return finalize_success_record(final_effective, start_time)
-            except PostProcessingError:
-                clear_progress()
-                final_effective = find_final_output(base_no_ext)
-                if audio_only and os.path.exists(final_effective):
-                    if audio_only:
-                        cleanup_thumbnails(base_no_ext)
-                    return finalize_success_record(final_effective, start_time)
-                return False, None, "Post-processing failed.", 0, 0
-            except OSError as e:
-                clear_progress()
-                if getattr(e, "errno", None) == errno.ENOSPC:
-                    return False, None, "No space left on device.", 0, 0
-                return False, None, f"File system error: {e}", 0, 0
-            except DownloadError as e:
-                clear_progress()
-                msg = _friendly_protection_message(str(e))
-                return False, None, msg, 0, 0
-            except ExtractorError as e:
-                clear_progress()
-                msg = _friendly_protection_message(str(e))
-                return False, None, msg, 0, 0
-            except Exception as e:
-                clear_progress()
-                return False, None, f"Unexpected: {type(e).__name__} - {e}", 0, 0
+        try:
+            if audio_only:
+                route = extract_audio(captured['filepath'], audio_policy(config),
+                                      config.get("audio_accept_codecs") or AUDIO_ACCEPT_CODECS, captured)
+                batch_counter_add("audio_encoded" if route["route"] == "mp3" else "audio_copied")
+                captured['ext'] = os.path.splitext(route["path"])[1].lstrip(".")
+                if ydl_postprocessors and cover_supported(captured['ext']):
+                    with yt_dlp.YoutubeDL(pp_opts) as ydl:
+                        if thumbnail_cache_enabled(config):
+                            attach_cached_cover(ydl, captured)
+                        ydl.post_process(route["path"], captured, captured.get('__files_to_move'))
+            else:
+                route = convert_video_to_mp4(captured['filepath'], captured, duration_seconds)
+                if route["route"] in ("remux", "transcode"):
+                    batch_counter_add(route["route"])
+                elif route["route"] == "kept":
+                    batch_counter_add("kept_container")
+                if route["saved"] is not None:
+                    batch_counter_add("cpu_saved", route["saved"])
+            if route["cpu"] is not None:
+                batch_counter_add("ffmpeg_cpu", route["cpu"])
+            if job is not None:
+                job.pp_route = route
+            return conclude_output(start_time)
+        except Exception as e:
+            return attempt_failure(e, start_time)
 
-        success, _, error_message, file_size, _download_time = attempt_download(url)
+    def conclude(success, final_effective, error_message, file_size):
         if success:
+            if hasher:
+                final_ext = os.path.splitext(final_effective)[1].lstrip(".")
+                existing = content_dedupe(hasher.content_key(final_ext), final_effective, file_size, dedupe_mode)
+                if existing:
+                    batch_counter_add("dedup_files")
+                    batch_counter_add("dedup_bytes", file_size)
+                    if job is not None:
+                        job.duplicate_of = existing
+                    if not os.path.exists(final_effective):
+                        final_effective = existing
+            if job is not None:
+                job.path = final_effective
+            if use_archive:
+                archive_add(url, extractor_key, video_id, archive_kind, final_effective, file_size)
             return True, "", file_size, duration_seconds
         else:
+            record_download_failure(url)
+            if job is not None:
+                job.error_class = _error_class(error_message)
             return False, error_message, file_size, duration_seconds
+
+    capture = capture_info_pp()
+    BANDWIDTH.job_started()
+    try:
+        success, final_effective, error_message, file_size, _download_time = attempt_download(resolved_info, capture)
     finally:
-        if temp_cookie_path and os.path.exists(temp_cookie_path):
-            try:
-                os.remove(temp_cookie_path)
-            except Exception:
-                pass
+        BANDWIDTH.job_finished()
+    if job is not None:
+        job.rate = meter.rate()
+    if not success:
+        return conclude(success, final_effective, error_message, file_size)
+
+    def postprocess():
+        return conclude(*run_postprocessors(capture.info, capture.started)[:4])
+
+    if job is not None and job.defer_pp:
+        job.pending_pp = postprocess
+        return True, "", 0, duration_seconds
+    return postprocess()
 
 # ---------------- Discord ----------------
-async def get_links_from_discord(config):
+# Each channel keeps the id of the newest message already harvested, so later
+# runs only page through messages posted after it.
+DISCORD_STREAM_BUFFER = 256
+DISCORD_URL_PATTERN = re.compile(r'http[s]?://(?:[a-zA-Z]|[0-9]|[$-_@.&+]|[!*\\(\\),]|(?:%[0-9a-fA-F][0-9a-fA-F]))+')
+
+register_db_schema("""
+CREATE TABLE IF NOT EXISTS discord_cursors (
+    channel_id INTEGER PRIMARY KEY,
+    last_message_id INTEGER NOT NULL,
+    updated INTEGER NOT NULL
+);
+""")
+
+def discord_channel_ids(value):
+    ids = []
+    for part in re.split(r"[\s,;]+", str(value or "").strip()):
+        if not part:
+            continue
+        if not part.isdigit():
+            return None
+        if int(part) not in ids:
+            ids.append(int(part))
+    return ids
+
+def discord_cursor_get(channel_id):
+    row = db_connect().execute(
+        "SELECT last_message_id FROM discord_cursors WHERE channel_id = ?", (channel_id,)
+    ).fetchone()
+    return row[0] if row else None
+
+def discord_cursor_commit(cursors):
+    if not cursors:
+        return
+    now = int(time.time())
+    with db_write() as conn:
+        conn.executemany(
+            "INSERT INTO discord_cursors (channel_id, last_message_id, updated) VALUES (?, ?, ?) "
+            "ON CONFLICT(channel_id) DO UPDATE SET last_message_id = MAX(last_message_id, excluded.last_message_id), "
+            "updated = excluded.updated",
+            [(cid, mid, now) for cid, mid in cursors.items()],
+        )
+
+async def _scan_discord_channel(client, channel_id, emit):
+    import discord
+    channel = client.get_channel(channel_id)
+    if channel is None:
+        try:
+            channel = await client.fetch_channel(channel_id)
+        except discord.Forbidden:
+            board_print(f"{Colors.RED}No permission to access channel {channel_id}, Check bot roles.{Colors.RESET}")
+            return None
+        except (discord.NotFound, discord.HTTPException):
+            board_print(f"{Colors.RED}Channel {channel_id} not found or no access.{Colors.RESET}")
+            return None
+
+    cursor = discord_cursor_get(channel_id)
+    after = discord.Object(id=cursor) if cursor else None
+    newest = cursor
+    scanned = 0
+    found = 0
+    started = time.monotonic()
+    label = f"'{channel.name}'" if getattr(channel, "name", None) else str(channel_id)
+    if cursor:
+        board_print(f"{Colors.YELLOW}Reading new messages in {label}...{Colors.RESET}")
+    else:
+        board_print(f"{Colors.YELLOW}Reading full history of {label}...{Colors.RESET}")
+    try:
+        async for message in channel.history(limit=None, after=after, oldest_first=True):
+            scanned += 1
+            if newest is None or message.id > newest:
+                newest = message.id
+            for raw in DISCORD_URL_PATTERN.findall(message.content or ""):
+                if await emit(raw):
+                    found += 1
+    except discord.Forbidden:
+        board_print(f"{Colors.RED}No permission to read {label}, Check bot roles.{Colors.RESET}")
+        return None
+    except discord.HTTPException as e:
+        board_print(f"{Colors.RED}Discord API error in {label}: {e}{Colors.RESET}")
+        return None
+    elapsed = time.monotonic() - started
+    board_print(f"{Colors.GREEN}{label}: {scanned} messages scanned, {found} links found in {elapsed:.1f}s{Colors.RESET}")
+    return newest if newest != cursor else None
+
+def discord_channel_setup(config):
     if not config.get("discord_bot_token"):
         token = input(f"{Colors.CYAN}Please enter your Discord bot token: {Colors.RESET}")
         config["discord_bot_token"] = token.strip()
         save_config(config)
 
     if not config.get("discord_channel_id"):
-        channel_id = input(f"{Colors.CYAN}Please enter the Discord channel ID: {Colors.RESET}")
+        channel_id = input(f"{Colors.CYAN}Please enter the Discord channel ID(s), comma separated: {Colors.RESET}")
         config["discord_channel_id"] = channel_id.strip()
         save_config(config)
 
     if not config.get("discord_bot_token") or not config.get("discord_channel_id"):
         print(f"{Colors.RED}Discord bot token or channel ID missing.{Colors.RESET}")
         wait_enter()
-        return []
+        return None
 
+    channel_ids = discord_channel_ids(config["discord_channel_id"])
+    if not channel_ids:
+        print(f"{Colors.RED}Invalid channel ID (numeric required).{Colors.RESET}")
+        wait_enter()
+        return None
+    return channel_ids
+
+# Logs in once, scans every channel concurrently and hands each new cleaned link
+# to the async emit callback. Returns the cursors to commit for the scanned channels,
+# or None after an error. Errors are only printed here: in streaming mode the batch
+# is already running on this loop, so pausing is left to the collect-mode caller.
+async def _harvest_discord(config, channel_ids, emit):
+    import discord
     intents = discord.Intents.default()
     intents.message_content = True
     client = discord.Client(intents=intents)
-    collected = []
+    seen = set()
+    cursors = {}
+    failed = False
 
-    url_pattern = re.compile(r'http[s]?://(?:[a-zA-Z]|[0-9]|[$-_@.&+]|[!*\\(\\),]|(?:%[0-9a-fA-F][0-9a-fA-F]))+')
+    async def emit_new(raw):
+        cu = clean_url(raw)
+        if cu and cu.startswith(("http://", "https://")) and cu not in seen:
+            seen.add(cu)
+            await emit(cu)
+            return True
+        return False
 
     @client.event
     async def on_ready():
-        print(f'{Colors.CYAN}Logged in as bot "{client.user}".{Colors.RESET}')
+        nonlocal failed
+        board_print(f'{Colors.CYAN}Logged in as bot "{client.user}".{Colors.RESET}')
         try:
-            try:
-                channel_id_int = int(config["discord_channel_id"])
-            except ValueError:
-                print(f"{Colors.RED}Invalid channel ID (numeric required).{Colors.RESET}")
-                client.cleaned_links = []
-                await client.close()
-                wait_enter()
-                return
-
-            channel = client.get_channel(channel_id_int)
-            if not channel:
-                print(f"{Colors.RED}Channel not found or no access.{Colors.RESET}")
-                client.cleaned_links = []
-                await client.close()
-                wait_enter()
-                return
-
-            print(f"{Colors.YELLOW}Reading messages in '{channel.name}'...{Colors.RESET}")
-            async for message in channel.history(limit=1000):
-                found = url_pattern.findall(message.content)
-                if found:
-                    collected.extend(found)
-
-            seen = set()
-            cleaned = []
-            for u in collected:
-                cu = clean_url(u)
-                if cu and cu.startswith(("http://", "https://")) and cu not in seen:
-                    seen.add(cu)
-                    cleaned.append(cu)
-
-            client.cleaned_links = cleaned
-            print(f"{Colors.GREEN}Found {len(cleaned)} links.{Colors.RESET}")
-            await client.close()
-        except discord.Forbidden:
-            print(f"{Colors.RED}No permission to access the channel, Check bot roles.{Colors.RESET}")
-            client.cleaned_links = []
-            await client.close()
-            wait_enter()
-        except discord.NotFound:
-            print(f"{Colors.RED}Channel/server not found.{Colors.RESET}")
-            client.cleaned_links = []
-            await client.close()
-            wait_enter()
-        except discord.HTTPException as e:
-            print(f"{Colors.RED}Discord API error: {e}{Colors.RESET}")
-            client.cleaned_links = []
-            await client.close()
-            wait_enter()
+            started = time.monotonic()
+            results = await asyncio.gather(
+                *(_scan_discord_channel(client, cid, emit_new) for cid in channel_ids)
+            )
+            for cid, newest in zip(channel_ids, results):
+                if newest:
+                    cursors[cid] = newest
+            if len(channel_ids) > 1:
+                board_print(f"{Colors.GREEN}Found {len(seen)} links in {len(channel_ids)} channels "
+                            f"({time.monotonic() - started:.1f}s).{Colors.RESET}")
         except Exception as e:
-            print(f"{Colors.RED}Error accessing Discord: {e}{Colors.RESET}")
-            client.cleaned_links = []
+            board_print(f"{Colors.RED}Error accessing Discord: {e}{Colors.RESET}")
+            failed = True
+        finally:
             await client.close()
-            wait_enter()
 
     try:
         await client.start(config["discord_bot_token"])
     except discord.errors.LoginFailure:
-        print(f"{Colors.RED}Invalid Discord token in config.json.{Colors.RESET}")
-        wait_enter()
-        return []
+        board_print(f"{Colors.RED}Invalid Discord token in config.json.{Colors.RESET}")
+        return None
     except Exception as e:
-        print(f"{Colors.RED}Unexpected Discord error: {e}{Colors.RESET}")
+        board_print(f"{Colors.RED}Unexpected Discord error: {e}{Colors.RESET}")
+        return None
+    return None if failed else cursors
+
+async def get_links_from_discord(config):
+    channel_ids = discord_channel_setup(config)
+    if not channel_ids:
+        return [], {}
+    cleaned = []
+
+    async def emit(cu):
+        cleaned.append(cu)
+
+    cursors = await _harvest_discord(config, channel_ids, emit)
+    if cursors is None:
         wait_enter()
-        return []
+        return cleaned, {}
+    return cleaned, cursors
+
+# Async iterable for process_links: links reach the download workers while the
+# history is still being paged. Cursors are filled in once every scan finished.
+async def stream_links_from_discord(config, channel_ids, cursors):
+    links = asyncio.Queue(maxsize=DISCORD_STREAM_BUFFER)
+    done = object()
 
-    return getattr(client, "cleaned_links", [])
+    async def run():
+        try:
+            cursors.update(await _harvest_discord(config, channel_ids, links.put) or {})
+        finally:
+            await links.put(done)
+
+    task = asyncio.create_task(run())
+    try:
+        while True:
+            item = await links.get()
+            if item is done:
+                break
+            yield item
+    finally:
+        if not task.done():
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
 
 # ---------------- Settings menu ----------------
 def open_settings_menu(config):
@@ -979,16 +2542,21 @@ def open_settings_menu(config):
         multi_local = bool(config.get("multi_download"))
         multi_label = f"{Colors.GREEN}On{Colors.RESET}" if multi_local else f"{Colors.YELLOW}Off{Colors.RESET}"
         max_conc_local = int(config.get("max_concurrent_downloads") or 3)
+        adaptive_local = bool(config.get("adaptive_concurrency"))
+        adaptive_label = f"{Colors.GREEN}On{Colors.RESET}" if adaptive_local else f"{Colors.YELLOW}Off{Colors.RESET}"
+        audio_policy_label = f"{Colors.GREEN}{audio_policy(config)}{Colors.RESET}"
 
         entries = [
             ("Bandwidth limit", rate_label_colored),
             ("Download path", str(config.get('download_path', '') or '')),
             ("Discord bot token", str(config.get('discord_bot_token', '') or '')),
-            ("Discord channel ID", str(config.get('discord_channel_id', '') or '')),
+            ("Discord channel IDs", str(config.get('discord_channel_id', '') or '')),
             ("Only audio", audio_only_label),
             ("MP3 cover embedding", embed_cover_label),
             ("Multi download", multi_label),
             ("Max concurrent downloads", str(max_conc_local)),
+            ("Adaptive concurrency", adaptive_label),
+            ("Audio policy", audio_policy_label),
         ]
         _clear()
         print(f"{Colors.CYAN}------------------- Settings --------------------{Colors.RESET}")
@@ -1005,19 +2573,21 @@ def open_settings_menu(config):
         print("Choose an option:")
         print("  [1] Change download path")
         print("  [2] Set/Change Discord bot token")
-        print("  [3] Set/Change Discord channel ID")
+        print("  [3] Set/Change Discord channel IDs")
         print("  [4] Global bandwidth limit")
         print("  [5] Toggle Only audio")
         print("  [6] Toggle MP3 cover embedding")
         print("  [7] Toggle Multi download")
         print("  [8] Set Max concurrent downloads")
+        print("  [9] Toggle Adaptive concurrency")
+        print("  [A] Cycle Audio policy (mp3 / smart / copy)")
         print("  [0] Back to menu")
         print(f"{Colors.CYAN}--------------------------------------------------{Colors.RESET}")
         choice = input(f"{Colors.CYAN}Selection: {Colors.RESET}").strip().lower()
 
         if choice == '0':
             break
-        if choice not in {'1','2','3','4','5','6','7','8'}:
+        if choice not in {'1','2','3','4','5','6','7','8','9','a'}:
             _clear()
             print(f"{Colors.RED}Invalid selection.{Colors.RESET}")
             _render()
@@ -1059,13 +2629,15 @@ def open_settings_menu(config):
             _clear()
             print("Selection: 3")
             current = str(config.get("discord_channel_id", "") or "")
-            cid = input(f"{Colors.CYAN}Enter Discord channel ID: {Colors.RESET}").strip()
+            cid = input(f"{Colors.CYAN}Enter Discord channel ID(s), comma separated: {Colors.RESET}").strip()
             if cid == "" or cid == current:
                 print(f"{Colors.YELLOW}No changes.{Colors.RESET}")
             else:
-                if not cid.isdigit():
+                ids = discord_channel_ids(cid)
+                if not ids:
                     print(f"{Colors.RED}Invalid channel ID (numeric).{Colors.RESET}")
                 else:
+                    cid = ",".join(str(i) for i in ids)
                     config["discord_channel_id"] = cid
                     save_config(config)
                     print(f"{Colors.GREEN}Discord channel ID updated.{Colors.RESET}")
@@ -1146,6 +2718,24 @@ def open_settings_menu(config):
                 print(f"{Colors.RED}Invalid number.{Colors.RESET}")
             _render()
 
+        elif choice == '9':
+            _clear()
+            print("Selection: 9")
+            config["adaptive_concurrency"] = not bool(config.get("adaptive_concurrency"))
+            save_config(config)
+            state = "On" if config["adaptive_concurrency"] else "Off"
+            print(f"{Colors.GREEN}Adaptive concurrency: {state}{Colors.RESET}")
+            _render()
+
+        elif choice == 'a':
+            _clear()
+            print("Selection: A")
+            current = audio_policy(config)
+            config["audio_policy"] = AUDIO_POLICIES[(AUDIO_POLICIES.index(current) + 1) % len(AUDIO_POLICIES)]
+            save_config(config)
+            print(f"{Colors.GREEN}Audio policy: {config['audio_policy']}{Colors.RESET}")
+            _render()
+
 # ---------------- Common UI prompt helper ----------------
 def prompt_start_or_back():
     print(f"{Colors.CYAN}Press Enter to start download or press B to return...{Colors.RESET}", end="", flush=True)
@@ -1153,107 +2743,831 @@ def prompt_start_or_back():
     print()
     return result == "enter"
 
+# ---------------- Batch journal ----------------
+# Every batch is journaled as it runs so an interrupted batch can be resumed and
+# failed links re-run. Queued/running updates are buffered; results flush at once.
+JOURNAL_FLUSH_EVERY = 256
+JOURNAL_FLUSH_SECONDS = 1.0
+JOURNAL_RETRY_STATES = ("failed", "parked")
+
+register_db_schema("""
+CREATE TABLE IF NOT EXISTS batches (
+    id INTEGER PRIMARY KEY,
+    created INTEGER NOT NULL,
+    source TEXT NOT NULL,
+    status TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS batch_items (
+    batch_id INTEGER NOT NULL,
+    url TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    state TEXT NOT NULL,
+    error_class TEXT,
+    message TEXT,
+    path TEXT,
+    updated INTEGER NOT NULL,
+    PRIMARY KEY (batch_id, url)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS batch_items_state ON batch_items (batch_id, state);
+CREATE TABLE IF NOT EXISTS batch_files (
+    batch_id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL,
+    position INTEGER NOT NULL
+);
+""")
+
+class BatchJournal:
+    def __init__(self, batch_id):
+        self.id = batch_id
+        self.pending = []
+        self.last_flush = time.monotonic()
+        self.position = None
+
+    @classmethod
+    def create(cls, source, path=None):
+        try:
+            with db_write() as conn:
+                cur = conn.execute(
+                    "INSERT INTO batches (created, source, status) VALUES (?, ?, 'running')",
+                    (int(time.time()), source)
+                )
+                if path:
+                    conn.execute(
+                        "INSERT INTO batch_files (batch_id, path, position) VALUES (?, ?, 0)",
+                        (cur.lastrowid, path)
+                    )
+                return cls(cur.lastrowid)
+        except sqlite3.Error:
+            return None
+
+    @classmethod
+    def reopen(cls, batch_id):
+        try:
+            with db_write() as conn:
+                conn.execute("UPDATE batches SET status = 'running' WHERE id = ?", (batch_id,))
+        except sqlite3.Error:
+            return None
+        return cls(batch_id)
+
+    def _add(self, sql, params, urgent=False):
+        self.pending.append((sql, params))
+        if urgent or len(self.pending) >= JOURNAL_FLUSH_EVERY or \
+                time.monotonic() - self.last_flush >= JOURNAL_FLUSH_SECONDS:
+            self.flush()
+
+    def flush(self):
+        self.last_flush = time.monotonic()
+        if not self.pending:
+            return
+        pending, self.pending = self.pending, []
+        try:
+            with db_write() as conn:
+                for sql, params in pending:
+                    conn.execute(sql, params)
+        except sqlite3.Error:
+            pass
+
+    def queued(self, job):
+        self._add(
+            "INSERT INTO batch_items (batch_id, url, seq, state, updated) VALUES (?, ?, ?, 'queued', ?) "
+            "ON CONFLICT(batch_id, url) DO UPDATE SET state = 'queued', updated = excluded.updated",
+            (self.id, job.url, job.seq, int(time.time()))
+        )
+
+    def update(self, job, state, message=None, path=None):
+        self._add(
+            "UPDATE batch_items SET state = ?, error_class = ?, message = ?, path = ?, updated = ? "
+            "WHERE batch_id = ? AND url = ?",
+            (state, job.error_class, message, path, int(time.time()), self.id, job.url),
+            urgent=state not in ("queued", "running")
+        )
+
+    # How far the batch's link file has been queued; flushed in order after the queued rows.
+    def read_to(self, position):
+        if position == self.position:
+            return
+        self.position = position
+        self._add("UPDATE batch_files SET position = ? WHERE batch_id = ?", (position, self.id))
+
+    def close(self, status="finished"):
+        self.flush()
+        try:
+            with db_write() as conn:
+                conn.execute("UPDATE batches SET status = ? WHERE id = ?", (status, self.id))
+        except sqlite3.Error:
+            pass
+
+def _file_unread(path, position):
+    try:
+        return os.path.getsize(path) > position
+    except OSError:
+        return True
+
+def journal_find_unfinished():
+    try:
+        rows = db_connect().execute(
+            "SELECT b.id, b.created, b.source, COUNT(i.url), f.path, f.position FROM batches b "
+            "LEFT JOIN batch_items i ON i.batch_id = b.id AND i.state IN ('queued', 'running') "
+            "LEFT JOIN batch_files f ON f.batch_id = b.id "
+            "WHERE b.status = 'running' GROUP BY b.id ORDER BY b.id DESC"
+        ).fetchall()
+    except sqlite3.Error:
+        return None
+    for batch_id, created, source, remaining, path, position in rows:
+        unread = path is not None and _file_unread(path, position)
+        if remaining or unread:
+            return {"id": batch_id, "created": created, "source": source, "remaining": remaining,
+                    "file": path if unread else None, "position": position}
+    return None
+
+def journal_find_failed():
+    try:
+        row = db_connect().execute(
+            "SELECT b.id, b.created, b.source, COUNT(i.url) FROM batches b "
+            "JOIN batch_items i ON i.batch_id = b.id AND i.state IN ('failed', 'parked') "
+            "WHERE b.status = 'finished' GROUP BY b.id ORDER BY b.id DESC LIMIT 1"
+        ).fetchone()
+    except sqlite3.Error:
+        return None
+    if not row:
+        return None
+    return {"id": row[0], "created": row[1], "source": row[2], "remaining": row[3]}
+
+def journal_urls(batch_id, states):
+    marks = ", ".join("?" for _ in states)
+    rows = db_connect().execute(
+        f"SELECT url FROM batch_items WHERE batch_id = ? AND state IN ({marks}) ORDER BY seq",
+        (batch_id, *states)
+    ).fetchall()
+    return [r[0] for r in rows]
+
+def journal_abandon(batch_id):
+    try:
+        with db_write() as conn:
+            conn.execute("UPDATE batches SET status = 'abandoned' WHERE id = ?", (batch_id,))
+    except sqlite3.Error:
+        pass
+
+# ---------------- Host scheduler ----------------
+HOST_BACKOFF_BASE = 5.0
+HOST_BACKOFF_MAX = 300.0
+HOST_RETRY_LIMIT = 2
+HOST_THROTTLE_CLASSES = {"rate_limited", "server"}
+# Failures that say nothing about the host's health.
+HOST_NEUTRAL_CLASSES = {"not_found", "disk", "postprocess", "output"}
+# Links buffered past the lookahead while every buffered host is capped or backing off.
+HOST_LOOKAHEAD_MAX = 10_000
+
+class HostState:
+    __slots__ = ("pending", "active", "next_at", "failures", "throttles", "open", "parked")
+
+    def __init__(self):
+        self.pending = deque()
+        self.active = 0
+        self.next_at = 0.0
+        self.failures = 0
+        self.throttles = 0
+        self.open = False
+        self.parked = []
+
+# Per-host queues with a concurrency cap, minimum spacing between starts,
+# exponential backoff after 429/5xx and a circuit breaker. Hosts are served
+# round-robin so a blocked host never holds up the others.
+class HostScheduler:
+    def __init__(self, config):
+        self.cap = max(1, int(config.get("per_host_max_concurrent") or 3))
+        self.spacing = max(0.0, float(config.get("per_host_min_interval_s") or 0))
+        self.threshold = max(1, int(config.get("host_failure_threshold") or 5))
+        self.hosts = {}
+        self.buffered = 0
+
+    def _state(self, host):
+        st = self.hosts.get(host)
+        if st is None:
+            st = self.hosts[host] = HostState()
+        return st
+
+    def add(self, job, front=False):
+        st = self._state(job.host)
+        if st.open:
+            st.parked.append(job)
+            return False
+        if front:
+            st.pending.appendleft(job)
+        else:
+            st.pending.append(job)
+        self.buffered += 1
+        return True
+
+    def pick(self, now):
+        soonest = None
+        for host, st in self.hosts.items():
+            if not st.pending or st.active >= self.cap:
+                continue
+            if st.next_at > now:
+                delay = st.next_at - now
+                soonest = delay if soonest is None else min(soonest, delay)
+                continue
+            job = st.pending.popleft()
+            self.buffered -= 1
+            st.active += 1
+            st.next_at = now + self.spacing
+            self.hosts[host] = self.hosts.pop(host)
+            return job, None
+        return None, soonest
+
+    def ready(self, now):
+        return any(st.pending and st.active < self.cap and st.next_at <= now for st in self.hosts.values())
+
+    def release(self, job, ok, error_class, now):
+        st = self._state(job.host)
+        st.active = max(0, st.active - 1)
+        if ok:
+            st.failures = 0
+            st.throttles = 0
+            return 0.0, False
+        if error_class in HOST_NEUTRAL_CLASSES:
+            return 0.0, False
+        st.failures += 1
+        backoff = 0.0
+        if error_class in HOST_THROTTLE_CLASSES:
+            st.throttles += 1
+            backoff = min(HOST_BACKOFF_MAX, HOST_BACKOFF_BASE * (2 ** (st.throttles - 1)))
+            st.next_at = max(st.next_at, now + backoff)
+        if st.failures >= self.threshold and not st.open:
+            st.open = True
+            self.buffered -= len(st.pending)
+            st.parked.extend(st.pending)
+            st.pending.clear()
+            return backoff, True
+        return backoff, False
+
+    def is_open(self, host):
+        st = self.hosts.get(host)
+        return bool(st and st.open)
+
+    def parked_by_host(self):
+        return {host: st.parked for host, st in self.hosts.items() if st.parked}
+
+# ---------------- Progress dashboard ----------------
+DASHBOARD_INTERVAL = 0.25
+DASHBOARD_MAX_JOBS = 12
+
+# Redraws a compact panel (one line per active job plus an aggregate line) at a
+# fixed rate from the event loop. Batch messages call clear() first so they are
+# printed above the panel; the next tick redraws it underneath.
+class ProgressBoard:
+    current = None
+
+    def __init__(self, batch):
+        self.batch = batch
+        self.active = {}
+        self.lines = 0
+        self.enabled = sys.stdout.isatty()
+        self.task = None
+        self.speed = 0.0
+        self.last_bytes = transfer_bytes_total()
+        self.last_time = time.monotonic()
+        self.done_bytes = 0
+        self.done_count = 0
+
+    def start(self):
+        ProgressBoard.current = self
+        if self.enabled:
+            self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+        self.clear()
+        if ProgressBoard.current is self:
+            ProgressBoard.current = None
+
+    def add(self, job):
+        self.active[job.seq] = job
+
+    def remove(self, job, size=0):
+        self.active.pop(job.seq, None)
+        if size:
+            self.done_bytes += size
+            self.done_count += 1
+
+    def clear(self):
+        if self.lines:
+            try:
+                sys.stdout.write(f"\x1b[{self.lines}F\x1b[J")
+                sys.stdout.flush()
+            except Exception:
+                pass
+            self.lines = 0
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(DASHBOARD_INTERVAL)
+            self._draw()
+
+    def _sample_speed(self):
+        now = time.monotonic()
+        total = transfer_bytes_total()
+        inst = (total - self.last_bytes) / max(0.001, now - self.last_time)
+        self.last_bytes, self.last_time = total, now
+        self.speed = inst if not self.speed else (0.7 * self.speed + 0.3 * inst)
+
+    def _job_line(self, meter, width):
+        total = meter.total or 0
+        pct = (meter.downloaded / total) if total else 0.0
+        spd = f"{format_bytes(meter.speed)}/s" if meter.speed else "--/s"
+        eta = format_seconds(meter.eta) if meter.eta is not None else "--:--"
+        tot = format_bytes(total) if total else "?"
+        stats = f"{make_bar(pct, 20)} {pct*100:5.1f}% {format_bytes(meter.downloaded)}/{tot} {spd:>11} ETA {eta}"
+        label_width = max(8, width - len(stats) - 6)
+        label = (meter.label or "")[:label_width]
+        return f"    {label:<{label_width}}  {stats}"
+
+    def _overall_eta(self):
+        remaining = 0
+        for job in self.active.values():
+            meter = job.meter
+            if meter is not None and meter.total:
+                remaining += max(0, meter.total - meter.downloaded)
+        waiting = max(0, self.batch.queued - self.batch.completed - len(self.active) - self.batch.converting)
+        if waiting:
+            if self.done_count:
+                avg = self.done_bytes / self.done_count
+            else:
+                totals = [j.meter.total for j in self.active.values() if j.meter is not None and j.meter.total]
+                avg = (sum(totals) / len(totals)) if totals else 0
+            remaining += waiting * avg
+        if self.speed <= 0 or remaining <= 0:
+            return None
+        return remaining / self.speed
+
+    def _draw(self):
+        self._sample_speed()
+        width = _terminal_width() - 1
+        out = []
+        for job in list(self.active.values())[:DASHBOARD_MAX_JOBS]:
+            meter = job.meter
+            if meter is not None:
+                out.append(self._job_line(meter, width)[:width])
+        waiting = max(0, self.batch.queued - self.batch.completed - len(self.active) - self.batch.converting)
+        eta = self._overall_eta()
+        eta_str = format_seconds(eta) if eta is not None else "--:--"
+        converting = f"Converting {self.batch.converting} | " if self.batch.converting else ""
+        summary = (f"    Active {len(self.active)} | Queued {waiting} | {converting}Done {self.batch.completed} | "
+                   f"{format_bytes(self.speed)}/s | ETA {eta_str}")
+        share = BANDWIDTH.fair_share()
+        if share:
+            summary += f" | Limit {format_bytes(share)}/s per job"
+        out.append(f"{Colors.CYAN}{summary[:width]}{Colors.RESET}")
+        self.clear()
+        try:
+            sys.stdout.write("\n".join(out) + "\n")
+            sys.stdout.flush()
+            self.lines = len(out)
+        except Exception:
+            pass
+
+def board_print(*args, **kwargs):
+    board = ProgressBoard.current
+    if board is not None:
+        board.clear()
+    print(*args, **kwargs)
+
 # ---------------- Process links ----------------
-async def process_links(links, config):
-    seen_raw = set()
-    normalized = []
-    for raw in links:
+class DownloadJob:
+    __slots__ = ("url", "seq", "host", "attempts", "rate", "fragments", "error_class", "skipped", "path",
+                 "duplicate_of", "meter", "expand", "expanded", "pending_expand", "defer_pp", "pending_pp",
+                 "pp_wait", "pp_time", "pp_route")
+
+    def __init__(self, url, seq):
+        self.url = url
+        self.seq = seq
+        self.host = url_domain(url)
+        self.attempts = 0
+        self.rate = 0.0
+        self.fragments = 0
+        self.error_class = None
+        self.skipped = False
+        self.path = None
+        self.duplicate_of = None
+        self.meter = None
+        self.expand = None
+        self.expanded = None
+        self.pending_expand = None
+        self.defer_pp = False
+        self.pending_pp = None
+        self.pp_wait = 0.0
+        self.pp_time = 0.0
+        self.pp_route = None
+
+# Links already queued in this batch, kept as 64-bit fingerprints. Past the
+# memory limit the fingerprints move to a private temporary SQLite database.
+SEEN_MEMORY_LIMIT = 500_000
+
+class LinkSeenSet:
+    def __init__(self, limit=SEEN_MEMORY_LIMIT):
+        self.limit = limit
+        self.memory = set()
+        self.conn = None
+
+    @staticmethod
+    def _fingerprint(url):
+        return int.from_bytes(hashlib.blake2b(url.encode("utf-8"), digest_size=8).digest(), "big", signed=True)
+
+    def _spill(self):
+        self.conn = sqlite3.connect("", isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=OFF")
+        self.conn.execute("PRAGMA synchronous=OFF")
+        self.conn.execute("CREATE TABLE seen (fp INTEGER PRIMARY KEY) WITHOUT ROWID")
+        self.conn.execute("BEGIN")
+        self.conn.executemany("INSERT INTO seen (fp) VALUES (?)", ((fp,) for fp in self.memory))
+        self.conn.execute("COMMIT")
+        self.memory = set()
+
+    def add(self, url):
+        fp = self._fingerprint(url)
+        if self.conn is not None:
+            return self.conn.execute("INSERT OR IGNORE INTO seen (fp) VALUES (?)", (fp,)).rowcount == 1
+        if fp in self.memory:
+            return False
+        self.memory.add(fp)
+        if len(self.memory) > self.limit:
+            self._spill()
+        return True
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+        self.memory = set()
+
+# Fixed pool of workers fed from a bounded queue; links can be added while it runs.
+# Workers take jobs through the host scheduler rather than in plain FIFO order.
+class DownloadBatch:
+    def __init__(self, config, journal=None):
+        self.config = config
+        self.journal = journal
+        multi_mode = bool(config.get("multi_download"))
+        max_conc = int(config.get("max_concurrent_downloads") or 3)
+        self.concurrency = max(1, max_conc) if multi_mode else 1
+        self.controller = ConcurrencyController(config) if multi_mode else None
+        if self.controller and self.controller.enabled:
+            self.concurrency = self.controller.max_downloads
+        else:
+            self.controller = None
+        self.queue = asyncio.Queue(maxsize=self.concurrency * 2)
+        self.sched = HostScheduler(config)
+        self.lookahead = max(64, self.concurrency * 16)
+        self.cond = None
+        self.executor = None
+        self.pp_executor = None
+        self.expand_executor = None
+        self.workers = []
+        self.side_tasks = set()
+        self.tuner = None
+        self.running = 0
+        self.converting = 0
+        self.expanding = 0
+        self.seen = LinkSeenSet()
+        self.queued = 0
+        self.completed = 0
+        self.failures = 0
+        self.feeding = True
+        self.board = ProgressBoard(self)
+
+    def start(self):
+        self.board.start()
+        self.cond = asyncio.Condition()
+        self.executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="universal-dl")
+        self.pp_executor = ThreadPoolExecutor(max_workers=POSTPROCESS_WORKERS, thread_name_prefix="universal-pp")
+        self.expand_executor = ThreadPoolExecutor(max_workers=PLAYLIST_EXPAND_WORKERS, thread_name_prefix="universal-expand")
+        self.workers = [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+        if self.controller:
+            self.tuner = asyncio.create_task(self._tune())
+
+    async def _tune(self):
+        while True:
+            await asyncio.sleep(ADAPTIVE_INTERVAL)
+            # Only judge a setting while every slot it allows is actually in use.
+            busy = self.running >= self.controller.downloads and self.sched.buffered > 0
+            decision = self.controller.sample(self.failures, busy)
+            if decision:
+                self.board.clear()
+                print(f"{Colors.YELLOW}    - {decision}{Colors.RESET}")
+                async with self.cond:
+                    self.cond.notify_all()
+
+    async def put(self, raw):
         cu = clean_url(raw)
-        if cu and cu not in seen_raw:
-            seen_raw.add(cu)
-            normalized.append(cu)
-
-    final_queue = []
-    seen_in_batch = set()
-    for u in normalized:
-        if not u.startswith(("http://", "https://")):
+        if not cu:
+            return False
+        if not cu.startswith(("http://", "https://")):
+            self.board.clear()
             print(f"{Colors.RED}    - Invalid link (http/https required){Colors.RESET}")
-            print(f"{Colors.YELLOW}      - Link: {u}{Colors.RESET}")
-            continue
-        if u in seen_in_batch:
-            print(f"{Colors.RED}    - Duplicate link skipped{Colors.RESET}")
-            print(f"{Colors.YELLOW}      - Link: {u}{Colors.RESET}")
-            continue
-        seen_in_batch.add(u)
-        final_queue.append(u)
+            print(f"{Colors.YELLOW}      - Link: {cu}{Colors.RESET}")
+            return False
+        if not self.seen.add(cu):
+            return False
+        self.queued += 1
+        job = DownloadJob(cu, self.queued)
+        if self.journal:
+            self.journal.queued(job)
+        await self.queue.put(job)
+        async with self.cond:
+            self.cond.notify()
+        return True
 
-    total = len(final_queue)
-    if total == 0:
-        return
+    def _expander(self, loop):
+        def expand(url):
+            return asyncio.run_coroutine_threadsafe(self.put(url), loop).result()
+        return expand
 
-    multi_mode = bool(config.get("multi_download"))
-    max_conc = int(config.get("max_concurrent_downloads") or 3)
+    def _spawn(self, coro):
+        task = asyncio.create_task(coro)
+        self.side_tasks.add(task)
+        task.add_done_callback(self.side_tasks.discard)
 
-    if not multi_mode or total == 1:
-        idx_seq = 0
-        for url in final_queue:
-            idx_seq += 1
+    async def join(self):
+        self.feeding = False
+        async with self.cond:
+            self.cond.notify_all()
+        try:
+            await asyncio.gather(*self.workers)
+            while self.side_tasks:
+                await asyncio.gather(*list(self.side_tasks))
+        finally:
+            if self.tuner:
+                self.tuner.cancel()
+            await self.board.stop()
+            self.executor.shutdown(wait=False)
+            self.pp_executor.shutdown(wait=False)
+            self.expand_executor.shutdown(wait=False)
+            self.seen.close()
+        self._report_parked()
+
+    def _drain_intake(self):
+        # Past the lookahead, keep reading while nothing buffered can start, so a long
+        # run of one host doesn't keep the other hosts from the idle slots.
+        now = time.monotonic()
+        while (self.sched.buffered < self.lookahead
+               or (self.sched.buffered < HOST_LOOKAHEAD_MAX and not self.sched.ready(now))):
             try:
-                success, message, file_size, video_duration = await asyncio.to_thread(
-                    download_universal_video, url, config
-                )
-            except Exception as e:
-                print(f"{Colors.RED}    - Download failed ({idx_seq}/{total}){Colors.RESET}")
-                print(f"{Colors.RED}      - Error: {e}{Colors.RESET}")
-                print(f"{Colors.YELLOW}      - Link: {url}{Colors.RESET}")
-                continue
+                job = self.queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            self.sched.add(job)
 
-            if success:
+    async def _next_job(self):
+        async with self.cond:
+            while True:
+                self._drain_intake()
+                wait = None
+                if not self.controller or self.running < self.controller.downloads:
+                    job, wait = self.sched.pick(time.monotonic())
+                    if job is not None:
+                        self.running += 1
+                        job.meter = JobMeter(job.url)
+                        self.board.add(job)
+                        if self.journal:
+                            self.journal.update(job, "running")
+                        return job
+                if (not self.feeding and self.queue.empty() and not self.sched.buffered
+                        and not self.running and not self.expanding):
+                    self.cond.notify_all()
+                    return None
                 try:
-                    size_str = format_bytes(file_size)
-                    length_str = format_seconds(video_duration)
-                    print(f"{Colors.GREEN}    - Download completed ({idx_seq}/{total}){Colors.RESET}")
-                    print(f"{Colors.GREEN}      - Size: {size_str}{Colors.RESET}")
-                    print(f"{Colors.GREEN}      - Length: {length_str}{Colors.RESET}")
-                except Exception:
+                    await asyncio.wait_for(self.cond.wait(), timeout=wait)
+                except asyncio.TimeoutError:
                     pass
-            else:
-                print(f"{Colors.RED}    - Download failed ({idx_seq}/{total}){Colors.RESET}")
-                if message:
-                    print(f"{Colors.RED}      - Error: {message}{Colors.RESET}")
-                print(f"{Colors.YELLOW}      - Link: {url}{Colors.RESET}")
-        return
-
-    sem = asyncio.Semaphore(max(1, max_conc))
-    counter_lock = asyncio.Lock()
-    completed = 0
 
-    async def next_done():
-        nonlocal completed
-        async with counter_lock:
-            completed += 1
-            return completed
+    def _progress_label(self):
+        return f"{self.completed}/{self.queued}+" if self.feeding else f"{self.completed}/{self.queued}"
 
-    async def worker(url):
-        async with sem:
+    async def _worker(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            job = await self._next_job()
+            if job is None:
+                return
+            if self.controller:
+                job.fragments = self.controller.fragments
+            job.expand = self._expander(loop)
+            job.defer_pp = True
             try:
-                success, message, file_size, video_duration = await asyncio.to_thread(
-                    download_universal_video, url, config
+                result = await loop.run_in_executor(
+                    self.executor, download_universal_video, job.url, self.config, job
                 )
             except Exception as e:
-                c = await next_done()
-                print(f"{Colors.RED}    - Download failed ({c}/{total}){Colors.RESET}")
-                print(f"{Colors.RED}      - Error: {e}{Colors.RESET}")
-                print(f"{Colors.YELLOW}      - Link: {url}{Colors.RESET}")
-                return
+                job.error_class = _error_class(str(e))
+                result = (False, str(e), 0, 0)
+            if job.pending_expand is not None:
+                # A playlist: free the download slot and the host before its entries are
+                # queued, so they can be scheduled while the rest of the list is read.
+                # Counted first so idle workers don't take the batch for finished.
+                self.expanding += 1
+                await self._release(job, result)
+                self._spawn(self._expand(job))
+                continue
+            if job.pending_pp is not None:
+                # Bytes are on disk: free the download slot and convert on the post-processing pool.
+                await self._release(job, result)
+                self._spawn(self._postprocess(job))
+                continue
+            await self._finish(job, result)
+
+    async def _expand(self, job):
+        loop = asyncio.get_running_loop()
+        try:
+            result = await loop.run_in_executor(self.expand_executor, job.pending_expand)
+        except Exception as e:
+            job.error_class = _error_class(str(e))
+            result = (False, f"Could not expand playlist: {e}", 0, 0)
+        finally:
+            job.pending_expand = None
+            async with self.cond:
+                self.expanding -= 1
+                self.cond.notify_all()
+        self.board.clear()
+        self._complete(job, result)
+
+    async def _postprocess(self, job):
+        loop = asyncio.get_running_loop()
+        queued_at = time.monotonic()
+        self.converting += 1
+
+        def run():
+            started = time.monotonic()
+            job.pp_wait = started - queued_at
+            try:
+                return job.pending_pp()
+            finally:
+                job.pp_time = time.monotonic() - started
+
+        try:
+            result = await loop.run_in_executor(self.pp_executor, run)
+        except Exception as e:
+            job.error_class = "postprocess"
+            result = (False, str(e), 0, 0)
+        finally:
+            self.converting -= 1
+            job.pending_pp = None
+        batch_counter_add("postprocess_jobs")
+        batch_counter_add("postprocess_wait", job.pp_wait)
+        batch_counter_add("postprocess_time", job.pp_time)
+        self.board.clear()
+        self._complete(job, result)
+
+    async def _release(self, job, result):
+        success = result[0]
+        self.board.remove(job, result[2] if success and not job.skipped else 0)
+        self.board.clear()
+        async with self.cond:
+            self.running -= 1
+            backoff, opened = self.sched.release(job, success, job.error_class, time.monotonic())
+            retry = (not success and not self.sched.is_open(job.host)
+                     and job.error_class in HOST_THROTTLE_CLASSES and job.attempts < HOST_RETRY_LIMIT)
+            if retry:
+                job.attempts += 1
+                self.sched.add(job, front=True)
+            self.cond.notify_all()
+        if opened:
+            print(f"{Colors.RED}    - Too many consecutive failures from {job.host}; parking its queued links{Colors.RESET}")
+        if retry:
+            print(f"{Colors.YELLOW}    - {result[1]} Retrying in {format_seconds(backoff)}{Colors.RESET}")
+            print(f"{Colors.YELLOW}      - Link: {job.url}{Colors.RESET}")
+        return retry
+
+    async def _finish(self, job, result):
+        if await self._release(job, result):
+            return
+        self._complete(job, result)
+
+    def _complete(self, job, result):
+        success = result[0]
+        job.expand = None
+        self.completed += 1
+        if not success:
+            self.failures += 1
+        if self.journal:
             if success:
-                try:
-                    size_str = format_bytes(file_size)
-                    length_str = format_seconds(video_duration)
-                    c = await next_done()
-                    print(f"{Colors.GREEN}    - Download completed ({c}/{total}){Colors.RESET}")
-                    print(f"{Colors.GREEN}      - Size: {size_str}{Colors.RESET}")
-                    print(f"{Colors.GREEN}      - Length: {length_str}{Colors.RESET}")
-                except Exception:
-                    pass
+                self.journal.update(job, "done", path=job.path)
             else:
-                c = await next_done()
-                print(f"{Colors.RED}    - Download failed ({c}/{total}){Colors.RESET}")
-                if message:
-                    print(f"{Colors.RED}      - Error: {message}{Colors.RESET}")
-                print(f"{Colors.YELLOW}      - Link: {url}{Colors.RESET}")
+                self.journal.update(job, "failed", message=result[1])
+        self._print_result(job, *result)
+
+    def _report_parked(self):
+        for host, jobs in self.sched.parked_by_host().items():
+            batch_counter_add("parked", len(jobs))
+            if self.journal:
+                for job in jobs:
+                    self.journal.update(job, "parked", message="Host circuit open.")
+            print(f"{Colors.YELLOW}    - Parked {len(jobs)} link(s) for {host} (circuit open){Colors.RESET}")
+
+    def _print_result(self, job, success, message, file_size, video_duration):
+        if job.expanded is not None:
+            print(f"{Colors.CYAN}    - Playlist expanded ({self._progress_label()}){Colors.RESET}")
+            print(f"{Colors.CYAN}      - {message}: {job.expanded} links queued{Colors.RESET}")
+        elif job.skipped:
+            print(f"{Colors.CYAN}    - Already downloaded, skipped ({self._progress_label()}){Colors.RESET}")
+            print(f"{Colors.YELLOW}      - Link: {job.url}{Colors.RESET}")
+        elif success:
+            try:
+                size_str = format_bytes(file_size)
+                length_str = format_seconds(video_duration)
+                print(f"{Colors.GREEN}    - Download completed ({self._progress_label()}){Colors.RESET}")
+                print(f"{Colors.GREEN}      - Size: {size_str}{Colors.RESET}")
+                print(f"{Colors.GREEN}      - Length: {length_str}{Colors.RESET}")
+                if job.duplicate_of:
+                    print(f"{Colors.GREEN}      - Duplicate of: {job.duplicate_of}{Colors.RESET}")
+                route_str = describe_conversion(job.pp_route) if job.pp_route else None
+                if route_str:
+                    print(f"{Colors.GREEN}      - {route_str}{Colors.RESET}")
+                if job.pp_time and job.pp_route and job.pp_route["route"] not in ("keep", "kept"):
+                    print(f"{Colors.GREEN}      - Converted in {job.pp_time:.1f}s (waited {job.pp_wait:.1f}s for a converter){Colors.RESET}")
+                if BANDWIDTH.rate and job.rate:
+                    limit_str = _rate_label(BANDWIDTH.rate)
+                    print(f"{Colors.GREEN}      - Rate: {format_bytes(job.rate)}/s of {limit_str} global limit{Colors.RESET}")
+            except Exception:
+                pass
+        else:
+            print(f"{Colors.RED}    - Download failed ({self._progress_label()}){Colors.RESET}")
+            if message:
+                print(f"{Colors.RED}      - Error: {message}{Colors.RESET}")
+            print(f"{Colors.YELLOW}      - Link: {job.url}{Colors.RESET}")
+
+async def process_links(links, config, source="links", journal=None, link_file=None):
+    batch_counters_reset()
+    BANDWIDTH.set_rate(config.get("max_download_rate_bps"))
+    if journal is None:
+        journal = BatchJournal.create(source, link_file.path if link_file else None)
+    batch = DownloadBatch(config, journal)
+    batch.start()
+    try:
+        if hasattr(links, "__aiter__"):
+            async for raw in links:
+                await batch.put(raw)
+        else:
+            for raw in links:
+                await batch.put(raw)
+                if journal and link_file:
+                    journal.read_to(link_file.position)
+    finally:
+        await batch.join()
+    if journal:
+        journal.close()
+    if batch.queued:
+        print_batch_summary()
+    return batch.queued
+
+def _format_batch_time(ts):
+    try:
+        return datetime.datetime.fromtimestamp(ts).strftime("%Y-%m-%d %H:%M")
+    except Exception:
+        return "?"
 
-    await asyncio.gather(*(worker(u) for u in final_queue))
+async def offer_resume_unfinished(config):
+    pending = journal_find_unfinished()
+    if not pending:
+        return False
+    when = _format_batch_time(pending["created"])
+    left = []
+    if pending["remaining"]:
+        left.append(f"{pending['remaining']} link(s)")
+    if pending["file"]:
+        left.append(f"the unread rest of {os.path.basename(pending['file'])}")
+    print(f"{Colors.YELLOW}An unfinished batch from {when} ({pending['source']}) has {' and '.join(left)} left.{Colors.RESET}")
+    print("[Press Enter to resume]   [D] Discard")
+    result = _wait_for_enter_or_char("d")
+    print()
+    if result != "enter":
+        journal_abandon(pending["id"])
+        return False
+    urls = journal_urls(pending["id"], ("queued", "running"))
+    link_file = None
+    if pending["file"]:
+        if os.path.isfile(pending["file"]):
+            link_file = LinkFile(pending["file"], pending["position"])
+            urls = chain(urls, link_file)
+        else:
+            print(f"{Colors.YELLOW}{pending['file']} is no longer there; its unread links are not resumed.{Colors.RESET}")
+    await process_links(urls, config, journal=BatchJournal.reopen(pending["id"]), link_file=link_file)
+    return True
+
+async def retry_failed_links(config):
+    failed = journal_find_failed()
+    if not failed:
+        print(f"{Colors.YELLOW}No failed links to retry.{Colors.RESET}")
+        return False
+    when = _format_batch_time(failed["created"])
+    print(f"{Colors.CYAN}Retrying {failed['remaining']} failed link(s) from the batch of {when} ({failed['source']}).{Colors.RESET}")
+    urls = journal_urls(failed["id"], JOURNAL_RETRY_STATES)
+    await process_links(urls, config, journal=BatchJournal.reopen(failed["id"]))
+    return True
 
 # ---------------- UI helpers ----------------
 def is_valid_download_path(path_str):
@@ -1285,6 +3599,26 @@ r"|_____|_|___|_____|\___/|_____|__|__|_____|__|__|_____|",
     if not check_ffmpeg():
         print(f"{Colors.YELLOW}WARNING: FFmpeg not found. Conversion may fail.{Colors.RESET}")
 
+# Yields non-empty lines lazily so downloads can start before the file is read.
+# Streams links from a .txt file, tracking the byte position of the next unread
+# line so an interrupted batch can continue the file where it stopped.
+class LinkFile:
+    def __init__(self, path, position=0):
+        self.path = os.path.abspath(path)
+        self.position = position
+
+    def __iter__(self):
+        try:
+            with open(self.path, 'rb') as f:
+                f.seek(self.position)
+                for line in f:
+                    url = line.decode('utf-8').strip()
+                    self.position += len(line)
+                    if url:
+                        yield url
+        except (OSError, UnicodeDecodeError) as e:
+            board_print(f"{Colors.RED}Error reading file: {e}{Colors.RESET}")
+
 def select_txt_file():
     try:
         import tkinter as tk
@@ -1317,21 +3651,47 @@ def select_txt_file():
         except Exception:
             return None
 
+# ---------------- Startup profile ----------------
+# Enabled with --profile-startup: times each startup phase from the first line
+# of this module to the main menu and prints the breakdown under the header.
+class StartupProfile:
+    def __init__(self):
+        self.enabled = False
+        self.phases = []
+        self._last = _STARTUP_T0
+
+    def mark(self, phase):
+        now = time.perf_counter()
+        self.phases.append((phase, now - self._last))
+        self._last = now
+
+    def report(self):
+        if not self.enabled or not self.phases:
+            return
+        print(f"{Colors.CYAN}Startup profile:{Colors.RESET}")
+        for phase, seconds in self.phases:
+            print(f"{Colors.CYAN}  - {phase}: {seconds * 1000:.1f} ms{Colors.RESET}")
+        total = sum(seconds for _, seconds in self.phases)
+        print(f"{Colors.CYAN}  - Total: {total * 1000:.1f} ms{Colors.RESET}")
+
+STARTUP = StartupProfile()
+
 # ---------------- Main loop ----------------
 async def main():
     ensure_console_size(cols=134, lines=30, buffer_lines=5000)
-
-    try:
-        await show_update_notice_if_any()
-    except Exception:
-        pass
+    STARTUP.mark("Console setup")
 
     config = load_config()
     if config is None:
         pause_on_error()
         return
+    STARTUP.mark("Config")
 
-    _init_stats_file()
+    # The update check and the FFmpeg probe run while the stats database opens.
+    update_check = start_update_check(config)
+    ffmpeg_probe = asyncio.create_task(asyncio.to_thread(probe_ffmpeg))
+    await asyncio.to_thread(_init_stats_file)
+    STARTUP.mark("Stats database")
 
     download_path = config.get("download_path")
     while not download_path or not is_valid_download_path(download_path):
@@ -1342,22 +3702,39 @@ async def main():
         download_path = str(Path(download_path_input).resolve())
         config["download_path"] = download_path.replace('\\', '/')
         save_config(config)
+    STARTUP.mark("Download path")
 
+    try:
+        await show_update_notice_if_any(update_check)
+    except Exception:
+        pass
+    STARTUP.mark("Update check")
+
+    await ffmpeg_probe
     render_header(config)
+    STARTUP.mark("Header (stats, FFmpeg)")
+    STARTUP.report()
+
+    if await offer_resume_unfinished(config):
+        input(f"\n{Colors.CYAN}Press Enter to return...{Colors.RESET}")
+        render_header(config)
 
     while True:
         links_to_download = []
+        links_source = "links"
+        links_file = None
         user_choice = input(f"""
 {Colors.CYAN}----------------------------------------------------{Colors.RESET}
   {Colors.CYAN}[1] Enter a link{Colors.RESET}
   {Colors.CYAN}[2] From a .txt file{Colors.RESET}
   {Colors.CYAN}[3] From a Discord channel{Colors.RESET}
+  {Colors.CYAN}[R] Retry failed links{Colors.RESET}
   {Colors.CYAN}[S] Settings{Colors.RESET}
 {Colors.CYAN}----------------------------------------------------{Colors.RESET}
 {Colors.CYAN}Selection: {Colors.RESET}""").strip().lower()
 
-        if user_choice not in {'1', '2', '3', 's'}:
-            print(f"{Colors.RED}Invalid selection (1/2/3/s).{Colors.RESET}")
+        if user_choice not in {'1', '2', '3', 'r', 's'}:
+            print(f"{Colors.RED}Invalid selection (1/2/3/r/s).{Colors.RESET}")
             input(f"{Colors.CYAN}Press Enter to return...{Colors.RESET}")
             render_header(config)
             continue
@@ -1375,7 +3752,7 @@ async def main():
                     render_header(config)
                     break
                 links_to_download = [user_input]
-                await process_links(links_to_download, config)
+                await process_links(links_to_download, config, source="link")
                 first_loop = False
             continue
 
@@ -1386,19 +3763,11 @@ async def main():
                 wait_enter()
                 render_header(config)
                 continue
-            collected = []
-            try:
-                with open(file_name, 'r', encoding='utf-8') as f:
-                    for line in f:
-                        url = line.strip()
-                        if url:
-                            collected.append(url)
-            except Exception as e:
-                print(f"{Colors.RED}Error reading file: {e}{Colors.RESET}")
-                wait_enter()
-                render_header(config)
-                continue
-            links_to_download = collected
+            links_file = LinkFile(file_name)
+            lines = iter(links_file)
+            first = next(lines, None)
+            links_to_download = chain([first], lines) if first is not None else None
+            links_source = f"file {os.path.basename(file_name)}"
             if not links_to_download:
                 print(f"{Colors.RED}No valid links in file.{Colors.RESET}")
                 input(f"{Colors.CYAN}Press Enter to return...{Colors.RESET}")
@@ -1406,20 +3775,42 @@ async def main():
                 continue
             else:
                 if not prompt_start_or_back():
+                    lines.close()
                     render_header(config)
                     continue
 
         elif user_choice == '3':
-            links_to_download = await get_links_from_discord(config)
+            if config.get("discord_streaming", True):
+                channel_ids = discord_channel_setup(config)
+                if not channel_ids:
+                    render_header(config)
+                    continue
+                discord_cursors = {}
+                stream = stream_links_from_discord(config, channel_ids, discord_cursors)
+                if not await process_links(stream, config, source="discord"):
+                    print(f"{Colors.YELLOW}No new links found / Discord access failed.{Colors.RESET}")
+                discord_cursor_commit(discord_cursors)
+                input(f"\n{Colors.CYAN}Press Enter to return...{Colors.RESET}")
+                render_header(config)
+                continue
+            links_to_download, discord_cursors = await get_links_from_discord(config)
+            links_source = "discord"
             if links_to_download:
                 if not prompt_start_or_back():
                     render_header(config)
                     continue
+                discord_cursor_commit(discord_cursors)
             else:
+                discord_cursor_commit(discord_cursors)
                 print(f"{Colors.YELLOW}No links found / Discord access failed.{Colors.RESET}")
                 wait_enter()
                 render_header(config)
                 continue
+        elif user_choice == 'r':
+            await retry_failed_links(config)
+            input(f"\n{Colors.CYAN}Press Enter to return...{Colors.RESET}")
+            render_header(config)
+            continue
         else:
             open_settings_menu(config)
             render_header(config)
@@ -1428,7 +3819,7 @@ async def main():
         if not links_to_download:
             continue
 
-        await process_links(links_to_download, config)
+        await process_links(links_to_download, config, source=links_source, link_file=links_file)
 
         input(f"\n{Colors.CYAN}Press Enter to return...{Colors.RESET}")
         render_header(config)
@@ -1436,4 +3827,6 @@ async def main():
 _INTERFACE_HOLDERS = (QuietLogger.debug, QuietLogger.warning, QuietLogger.error, download_universal_video)
 
 if __name__ == "__main__":
+    STARTUP.enabled = "--profile-startup" in sys.argv[1:]
+    STARTUP.mark("Module load")
     asyncio.run(main())